@@ -0,0 +1,363 @@
+"""
+Command line interface of cryptosystem, works without Tk:
+
+    python -m ElGamalCipher keygen --key-dir keys --bits 2048
+    python -m ElGamalCipher encrypt --key-dir keys --jobs 4 'data/*.csv'
+    python -m ElGamalCipher decrypt --key-dir keys --output-dir plain 'data/*.egc'
+    python -m ElGamalCipher self-test
+
+Files are processed concurrently by --jobs processes, throughput of every
+file is printed when it's done. Exit codes:
+    0 - all files are processed
+    1 - some files failed
+    2 - wrong arguments or no input files found
+    3 - keys can't be generated, saved or loaded
+    130 - interrupted
+"""
+import argparse
+import contextlib
+import glob
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import ElGamalCipher.arithmetic as arithmetic
+import ElGamalCipher.encryption as encryption
+import ElGamalCipher.groups as groups
+from ElGamalCipher.settings import DEFAULT_KEY_PATH, KEY_SIZE, KEY_PROFILE, CIPHER_MODE
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_KEYS = 3
+EXIT_INTERRUPTED = 130
+
+# Suffix of encrypted files, it's removed from names of decrypted files
+ENCRYPTED_SUFFIX = '.egc'
+DECRYPTED_SUFFIX = '.dec'
+
+# Cipher of job process
+_cipher = None
+
+
+def _init_job(keys, backend):
+    """
+    Initializing cipher of job process
+    :param keys: dict that includes public, private and session key
+    :param backend: name of arithmetic backend
+    :return: None
+    """
+    global _cipher
+    arithmetic.set_backend(backend)
+    _cipher = encryption.ElGamal()
+    _cipher.set_keys(keys)
+
+
+def _run_job(command, input_file_name, output_file_name, options):
+    """
+    Encrypting or decrypting one file
+    :param command: 'encrypt' or 'decrypt'
+    :param input_file_name: path to input file
+    :param output_file_name: path to output file, it's removed if job fails
+    :param options: keyword arguments of ElGamal.encrypt_file or ElGamal.decrypt_file
+    :return: size of input file (in bytes), time (in seconds) and error message (None if successful)
+    """
+    start = perf_counter()
+    try:
+        size = os.path.getsize(input_file_name)
+        if command == 'encrypt':
+            # Files mustn't share session key, one known block would reveal all of them
+            _cipher.keys['session'] = _cipher.generate_session_key()
+            _cipher.encrypt_file(input_file_name, output_file_name, **options)
+        else:
+            _cipher.decrypt_file(input_file_name, output_file_name, **options)
+        return size, perf_counter() - start, None
+    except Exception as e:
+        if os.path.isfile(output_file_name):
+            os.remove(output_file_name)
+        return 0, perf_counter() - start, str(e) or type(e).__name__
+
+
+def expand_inputs(patterns):
+    """
+    Expanding glob patterns into list of files
+    :param patterns: paths or glob patterns ('**' matches subdirectories)
+    :return: list of existing files (without duplicates) and list of patterns that matched nothing
+    """
+    files = []
+    missing = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        matches = [path for path in matches if os.path.isfile(path)]
+        if not matches:
+            missing.append(pattern)
+        files.extend(path for path in matches if path not in files)
+    return files, missing
+
+
+def output_name(input_file_name, command, output_dir=None):
+    """
+    Making name of output file: ENCRYPTED_SUFFIX is added to encrypted file,
+    and removed from decrypted file (or DECRYPTED_SUFFIX is added)
+    :param input_file_name: path to input file
+    :param command: 'encrypt' or 'decrypt'
+    :param output_dir: directory of output file (directory of input file if it's not set)
+    :return: path to output file
+    """
+    directory, name = os.path.split(input_file_name)
+    if command == 'encrypt':
+        name += ENCRYPTED_SUFFIX
+    elif name.endswith(ENCRYPTED_SUFFIX) and len(name) > len(ENCRYPTED_SUFFIX):
+        name = name[:-len(ENCRYPTED_SUFFIX)]
+    else:
+        name += DECRYPTED_SUFFIX
+    return os.path.join(output_dir if output_dir is not None else directory, name)
+
+
+def format_size(size):
+    if size < 1024:
+        return f'{size} B'
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+
+
+def keygen(args):
+    """
+    Generating keys and saving them to key directory
+    :return: exit code
+    """
+    cipher = encryption.ElGamal()
+    public_file = os.path.join(args.key_dir, 'id_elgamal.pub')
+    if os.path.exists(public_file) and not args.force:
+        print(f'Keys already exist in {args.key_dir} (use --force to replace them)', file=sys.stderr)
+        return EXIT_KEYS
+
+    start = perf_counter()
+    try:
+        cipher.generate_keys(args.bits, group=args.group, profile=args.profile)
+    except (AssertionError, KeyError) as e:
+        print(f'Key generation failed: {e}', file=sys.stderr)
+        return EXIT_KEYS
+    if not cipher.save_keys(args.key_dir):
+        print(f'Keys can\'t be saved to {args.key_dir}', file=sys.stderr)
+        return EXIT_KEYS
+    bits = cipher.keys['public']['p'].bit_length()
+    print(f'Generated {bits}-bit keys ({args.profile} profile) in {perf_counter() - start:.2f} s, '
+          f'saved to {args.key_dir}')
+    return EXIT_OK
+
+
+def process_files(args):
+    """
+    Encrypting or decrypting input files concurrently
+    :return: exit code
+    """
+    files, missing = expand_inputs(args.inputs)
+    for pattern in missing:
+        print(f'{pattern}: no such file', file=sys.stderr)
+    if not files:
+        return EXIT_USAGE
+
+    cipher = encryption.ElGamal()
+    if not cipher.load_keys(args.key_dir, private=args.command == 'decrypt'):
+        print(f'Keys can\'t be loaded from {args.key_dir}', file=sys.stderr)
+        return EXIT_KEYS
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    options = {'mode': args.mode, 'workers': 1}
+
+    tasks = []
+    outputs = set()
+    for input_file_name in files:
+        output_file_name = output_name(input_file_name, args.command, args.output_dir)
+        if os.path.abspath(output_file_name) in outputs or \
+                os.path.abspath(output_file_name) == os.path.abspath(input_file_name):
+            print(f'{input_file_name}: FAILED (output file {output_file_name} is used twice)', file=sys.stderr)
+        elif os.path.exists(output_file_name) and not args.overwrite:
+            print(f'{input_file_name}: FAILED (output file {output_file_name} exists, use --overwrite)',
+                  file=sys.stderr)
+        else:
+            outputs.add(os.path.abspath(output_file_name))
+            tasks.append((input_file_name, output_file_name))
+
+    def report(input_file_name, output_file_name, result):
+        size, seconds, error = result
+        if error:
+            print(f'{input_file_name}: FAILED ({error})', file=sys.stderr)
+            return False
+        speed = size / 2 ** 20 / seconds if seconds else 0.0
+        print(f'{input_file_name} -> {output_file_name}: {format_size(size)} in {seconds:.2f} s ({speed:.2f} MB/s)')
+        return True
+
+    start = perf_counter()
+    total = 0
+    succeeded = 0
+    jobs = args.jobs or os.cpu_count() or 1
+    backend = arithmetic.get_backend().name
+    if jobs == 1 or len(tasks) == 1:
+        _init_job(cipher.keys, backend)
+        for input_file_name, output_file_name in tasks:
+            result = _run_job(args.command, input_file_name, output_file_name, options)
+            succeeded += report(input_file_name, output_file_name, result)
+            total += result[0]
+    else:
+        with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_job,
+                                 initargs=(cipher.keys, backend)) as executor:
+            futures = {executor.submit(_run_job, args.command, input_file_name, output_file_name, options):
+                       (input_file_name, output_file_name)
+                       for input_file_name, output_file_name in tasks}
+            for future in as_completed(futures):
+                result = future.result()
+                succeeded += report(*futures[future], result)
+                total += result[0]
+
+    seconds = perf_counter() - start
+    speed = total / 2 ** 20 / seconds if seconds else 0.0
+    print(f'{succeeded} of {len(files) + len(missing)} files processed, '
+          f'{format_size(total)} in {seconds:.2f} s ({speed:.2f} MB/s)')
+    return EXIT_OK if succeeded == len(files) + len(missing) else EXIT_FAILED
+
+
+def self_test():
+    """
+    Checking naming of files and exit codes of commands in temporary directory
+    :return: exit code
+    """
+    assert output_name('a/b.txt', 'encrypt') == os.path.join('a', 'b.txt.egc'), "Wrong name of encrypted file!"
+    assert output_name('a/b.txt.egc', 'decrypt', 'c') == os.path.join('c', 'b.txt'), "Wrong name of decrypted file!"
+    assert output_name('b.txt', 'decrypt') == 'b.txt.dec' and output_name('.egc', 'decrypt') == '.egc.dec', \
+        "Wrong name of decrypted file without suffix!"
+    assert [format_size(size) for size in (0, 1023, 1024, 3 * 2 ** 20, 2 ** 50)] == \
+        ['0 B', '1023 B', '1.0 KB', '3.0 MB', '1048576.0 GB'], "Wrong formatting of sizes!"
+
+    def write(file_name, data):
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+    def read(file_name):
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    def run(*args):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            try:
+                return main(list(args))
+            except SystemExit as e:
+                return e.code
+
+    global process_files
+    work_dir = tempfile.mkdtemp(prefix='elgamal_test_')
+    try:
+        key_dir, data_dir, plain_dir = (os.path.join(work_dir, name) for name in ('keys', 'data', 'plain'))
+        os.makedirs(os.path.join(data_dir, 'sub'))
+        inputs = [os.path.join(data_dir, name) for name in ('a.csv', 'b.csv', os.path.join('sub', 'c.csv'))]
+        for index, input_file_name in enumerate(inputs):
+            write(input_file_name, os.urandom(100 * index))
+        pattern = os.path.join(data_dir, '**', '*.csv')
+        files, missing = expand_inputs([pattern, inputs[0], os.path.join(data_dir, '*.txt')])
+        assert files == sorted(inputs) and missing == [os.path.join(data_dir, '*.txt')], "Wrong expanded inputs!"
+
+        assert run('keygen', '--key-dir', key_dir, '--group', 'ffdhe2048') == EXIT_OK, "Keys aren't generated!"
+        assert run('keygen', '--key-dir', key_dir, '--group', 'ffdhe2048') == EXIT_KEYS, "Keys are replaced!"
+        assert run('keygen', '--key-dir', key_dir, '--group', 'ffdhe2048', '--force') == EXIT_OK, \
+            "Keys aren't replaced with --force!"
+
+        assert run('encrypt', '--key-dir', key_dir, pattern) == EXIT_OK, "Files aren't encrypted!"
+        assert all(os.path.isfile(name + ENCRYPTED_SUFFIX) for name in inputs), "Wrong names of encrypted files!"
+        assert run('encrypt', '--key-dir', key_dir, pattern) == EXIT_FAILED, "Encrypted files are replaced!"
+        assert run('encrypt', '--key-dir', key_dir, '--overwrite', '--jobs', '2', pattern) == EXIT_OK, \
+            "Files aren't encrypted concurrently!"
+        encrypted = os.path.join(data_dir, '**', '*' + ENCRYPTED_SUFFIX)
+        assert run('decrypt', '--key-dir', key_dir, '--output-dir', plain_dir, encrypted) == EXIT_OK, \
+            "Files aren't decrypted!"
+        for input_file_name in inputs:
+            decrypted = os.path.join(plain_dir, os.path.basename(input_file_name))
+            assert read(decrypted) == read(input_file_name), f"Decrypted file {decrypted} differs!"
+
+        # Failed files, missing inputs and keys, wrong arguments
+        damaged = inputs[2] + ENCRYPTED_SUFFIX
+        write(damaged, read(damaged)[:-1])
+        damaged_dir = os.path.join(work_dir, 'damaged')
+        assert run('decrypt', '--key-dir', key_dir, '--output-dir', damaged_dir, damaged) == EXIT_FAILED, \
+            "Damaged file is decrypted!"
+        assert not os.listdir(damaged_dir), "Output of damaged file isn't removed!"
+        assert run('encrypt', '--key-dir', key_dir, '--overwrite', inputs[0], 'missing.csv') == EXIT_FAILED, \
+            "Missing file isn't counted as failed!"
+        assert run('encrypt', '--key-dir', key_dir, 'missing.csv') == EXIT_USAGE, "Missing inputs aren't reported!"
+        assert run('decrypt', '--key-dir', plain_dir, encrypted) == EXIT_KEYS, "Missing keys aren't reported!"
+        assert run('encrypt', '--jobs', '-1', inputs[0]) == EXIT_USAGE, "Negative jobs are accepted!"
+        assert run('encrypt', '--mode', 'unknown', inputs[0]) == EXIT_USAGE, "Unknown mode is accepted!"
+
+        def interrupted(args):
+            raise KeyboardInterrupt()
+
+        process_files, original = interrupted, process_files
+        try:
+            assert run('encrypt', inputs[0]) == EXIT_INTERRUPTED, "Interruption isn't reported!"
+        finally:
+            process_files = original
+    finally:
+        shutil.rmtree(work_dir)
+
+    print('All tests passed')
+    return EXIT_OK
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m ElGamalCipher', description='ElGamal cryptosystem')
+    parser.add_argument('--backend', choices=arithmetic.available_backends(),
+                        default=arithmetic.get_backend().name, help='arithmetic backend')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_keygen = commands.add_parser('keygen', help='generate keys')
+    parser_keygen.add_argument('--key-dir', default=DEFAULT_KEY_PATH, help='directory to save keys to')
+    parser_keygen.add_argument('--bits', type=int, default=KEY_SIZE, help='size of p (in bits)')
+    parser_keygen.add_argument('--group', choices=sorted(groups.GROUPS),
+                               help='standard group used instead of generating p and g')
+    parser_keygen.add_argument('--profile', choices=(encryption.KEY_PROFILE_FULL, encryption.KEY_PROFILE_SUBGROUP),
+                               default=KEY_PROFILE, help='key profile')
+    parser_keygen.add_argument('--force', action='store_true', help='replace existing keys')
+
+    for command, help_message in (('encrypt', 'encrypt files'), ('decrypt', 'decrypt files')):
+        parser_command = commands.add_parser(command, help=help_message)
+        parser_command.add_argument('inputs', nargs='+', metavar='FILE', help='input files or glob patterns')
+        parser_command.add_argument('--key-dir', default=DEFAULT_KEY_PATH, help='directory with keys')
+        parser_command.add_argument('--output-dir', help='directory of output files (default: next to input)')
+        parser_command.add_argument('-j', '--jobs', type=int, default=1,
+                                    help='quantity of files processed concurrently (0 is quantity of CPUs)')
+        parser_command.add_argument('--overwrite', action='store_true', help='replace existing output files')
+        if command == 'encrypt':
+            parser_command.add_argument('--mode', choices=list(encryption.MODE_CODES),
+                                        help=f'cipher mode (default: {CIPHER_MODE}, {encryption.MODE_HYBRID} '
+                                             f'for keys of subgroup profile)')
+        else:
+            parser_command.add_argument('--mode', choices=[encryption.MODE_BYTE, encryption.MODE_BLOCK],
+                                        default=encryption.MODE_BYTE,
+                                        help='mode of legacy text files (binary files are detected automatically)')
+
+    commands.add_parser('self-test', help='check naming of files and exit codes of commands')
+
+    args = parser.parse_args(args)
+    if getattr(args, 'jobs', 0) < 0:
+        parser.error('--jobs must not be negative')
+    arithmetic.set_backend(args.backend)
+
+    try:
+        if args.command == 'keygen':
+            return keygen(args)
+        if args.command == 'self-test':
+            return self_test()
+        return process_files(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+asyncio interface of ElGamal cipher and prime numbers generation.
+
+Blocking work runs in executor (default executor of event loop if it isn't
+set) by chunks: files are read by chunks of STREAM_CHUNK_SIZE bytes and
+prime numbers are searched by sieved windows. Between chunks progress is
+reported to event loop and cancellation is checked, so one event loop can
+run many jobs without stalling other coroutines.
+
+File jobs run only in thread executors: job reports progress to event loop
+from the worker, so it can't be sent to another process. Prime search runs
+in any executor.
+"""
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from os import remove
+from os.path import getsize, isfile
+
+import ElGamalCipher.encryption as encryption
+import ElGamalCipher.primes as primes
+from ElGamalCipher.core import JobCancelled, ProgressReader
+
+# Progress of file job: processed and total size of input file (in bytes)
+Progress = namedtuple('Progress', ['processed', 'total'])
+# Progress of prime search: quantity of tested candidates and found prime (None until it's found)
+PrimeProgress = namedtuple('PrimeProgress', ['candidates', 'prime'])
+
+
+class CipherJob:
+    """
+    Encryption or decryption of file running in executor. Job is awaitable
+    (result of cipher method) and async iterable (Progress after every chunk).
+    If job is cancelled, partially written output file is removed before
+    awaiting of job ends
+    """
+
+    def __init__(self, method, input_file_name, output_file_name, executor=None, **kwargs):
+        """
+        :param method: encrypt_stream or decrypt_stream method of job's own cipher
+        :param input_file_name: path to input file
+        :param output_file_name: path to output file, removed if job fails or is cancelled
+        :param executor: ThreadPoolExecutor to run job in (None is default executor of event loop)
+        :param kwargs: other arguments of cipher method
+        """
+        assert input_file_name and isfile(input_file_name), "Input file wasn't selected!"
+        assert output_file_name, "Output file wasn't selected!"
+        assert executor is None or isinstance(executor, ThreadPoolExecutor), \
+            "File jobs can run only in thread executor!"
+        self.method = method
+        self.input_file_name = input_file_name
+        self.output_file_name = output_file_name
+        self.kwargs = kwargs
+        self.processed = 0
+        self.total = getsize(input_file_name)
+        self.is_cancelled = False
+
+        self._loop = asyncio.get_running_loop()
+        self._progress = asyncio.Queue()
+        self._future = self._loop.run_in_executor(executor, self._run)
+        # None in queue means that job is finished
+        self._future.add_done_callback(lambda _: self._progress.put_nowait(None))
+
+    def _run(self):
+        """
+        Running cipher method (in executor)
+        :return: result of cipher method
+        """
+        try:
+            with open(self.input_file_name, 'rb') as reader, open(self.output_file_name, 'wb') as writer:
+                return self.method(ProgressReader(reader, self.report, lambda: self.is_cancelled),
+                                   writer, **self.kwargs)
+        except BaseException:
+            if isfile(self.output_file_name):
+                remove(self.output_file_name)
+            raise
+
+    def report(self, size):
+        """
+        Reporting processed bytes to event loop (called from executor)
+        :param size: quantity of bytes processed since the last report
+        :return: None
+        """
+        self.processed += size
+        self._loop.call_soon_threadsafe(self._progress.put_nowait, Progress(self.processed, self.total))
+
+    def cancel(self):
+        """
+        Cancelling job, it stops after the current chunk
+        :return: None
+        """
+        self.is_cancelled = True
+
+    def done(self):
+        # Future of executor is shielded from cancellation, so it's done only when worker has finished
+        return self._future.done()
+
+    async def __aiter__(self):
+        while True:
+            progress = await self._progress.get()
+            if progress is None:
+                return
+            yield progress
+
+    async def _wait(self):
+        try:
+            return await asyncio.shield(self._future)
+        except JobCancelled:
+            raise asyncio.CancelledError()
+        except asyncio.CancelledError:
+            # Coroutine that waits for job is cancelled, so job is cancelled too.
+            # Worker stops after the current chunk and removes partial output
+            self.cancel()
+            await asyncio.wait([self._future])
+            # Result isn't needed anymore, exception of worker is retrieved to not be logged
+            self._future.exception()
+            raise
+
+    def __await__(self):
+        return self._wait().__await__()
+
+
+def _job_cipher(cipher):
+    """
+    Creating own cipher of job: caches of cipher aren't shared between concurrent jobs
+    :param cipher: ElGamal object with configured keys
+    :return: ElGamal object with copy of keys
+    """
+    job_cipher = encryption.ElGamal()
+    job_cipher.set_keys(deepcopy(cipher.keys))
+    return job_cipher
+
+
+def encrypt_file(cipher, input_file_name, output_file_name, executor=None, **kwargs):
+    """
+    Starting encryption of file in executor. Must be called from running event loop
+    :param cipher: ElGamal object with configured keys
+    :param input_file_name: path to input file
+    :param output_file_name: path to output file
+    :param executor: ThreadPoolExecutor to run encryption in (None is default executor of event loop)
+    :param kwargs: other arguments of ElGamal.encrypt_stream (mode, fresh_session, workers)
+    :return: CipherJob
+    """
+    return CipherJob(_job_cipher(cipher).encrypt_stream, input_file_name, output_file_name, executor, **kwargs)
+
+
+def decrypt_file(cipher, input_file_name, output_file_name, executor=None, **kwargs):
+    """
+    Starting decryption of file in executor. Must be called from running event loop
+    :param cipher: ElGamal object with configured keys
+    :param input_file_name: path to input file
+    :param output_file_name: path to output file
+    :param executor: ThreadPoolExecutor to run decryption in (None is default executor of event loop)
+    :param kwargs: other arguments of ElGamal.decrypt_stream (mode, workers)
+    :return: CipherJob
+    """
+    return CipherJob(_job_cipher(cipher).decrypt_stream, input_file_name, output_file_name, executor, **kwargs)
+
+
+async def search_prime(key_size=1024, safe=False, executor=None):
+    """
+    Searching prime number in executor by windows of candidates
+    :param key_size: size of number to generate (in bits)
+    :param safe: if True, safe prime p = 2q + 1 is searched
+    :param executor: executor to run search in (None is default executor of event loop)
+    :return: async generator of PrimeProgress, the last one contains found prime
+    """
+    loop = asyncio.get_running_loop()
+    candidates = 0
+    while True:
+        num, tested = await loop.run_in_executor(executor, primes.search_prime, key_size, safe)
+        candidates += tested
+        yield PrimeProgress(candidates, num)
+        if num:
+            return
+
+
+async def generate_large_prime(key_size=1024, safe=False, executor=None):
+    """
+    Generating large prime number in executor
+    :param key_size: size of number to generate (in bits)
+    :param safe: if True, safe prime p = 2q + 1 is generated
+    :param executor: executor to run search in (None is default executor of event loop)
+    :return: generated prime number
+    """
+    async for progress in search_prime(key_size, safe, executor):
+        if progress.prime:
+            return progress.prime
+
+
+if __name__ == '__main__':
+    # Concurrent jobs and cancellation tests
+    import os
+    import shutil
+    import tempfile
+
+    from ElGamalCipher.encryption import MODE_BLOCK, MODE_HYBRID
+    from ElGamalCipher.settings import STREAM_CHUNK_SIZE
+
+    def write(file_name, data):
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+    def read(file_name):
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    async def test(cipher, work_dir):
+        plain_file = os.path.join(work_dir, 'plain')
+        data = os.urandom(10000)
+        write(plain_file, data)
+
+        # Concurrent jobs with one cipher
+        modes = (MODE_BLOCK, MODE_HYBRID, MODE_BLOCK, MODE_HYBRID)
+        cipher_files = [os.path.join(work_dir, f'cipher{i}') for i in range(len(modes))]
+        await asyncio.gather(*(encrypt_file(cipher, plain_file, cipher_file, mode=mode)
+                               for cipher_file, mode in zip(cipher_files, modes)))
+        decrypted_files = [os.path.join(work_dir, f'decrypted{i}') for i in range(len(modes))]
+        await asyncio.gather(*(decrypt_file(cipher, cipher_file, decrypted_file)
+                               for cipher_file, decrypted_file in zip(cipher_files, decrypted_files)))
+        for decrypted_file in decrypted_files:
+            assert read(decrypted_file) == data, "Decrypted file differs!"
+        assert not cipher.secret_cache.hits + cipher.secret_cache.misses, "Cipher is shared between jobs!"
+
+        # Cancelling coroutine that awaits job removes output before awaiting ends
+        write(plain_file, os.urandom(4 * STREAM_CHUNK_SIZE))
+        cipher_file = cipher_files[0]
+        job = encrypt_file(cipher, plain_file, cipher_file, mode=MODE_BLOCK)
+        task = asyncio.ensure_future(job)
+        async for progress in job:
+            assert progress.processed < progress.total, "Job is finished before cancellation!"
+            break
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("Job isn't cancelled!")
+        assert job.done(), "Worker is running after cancellation!"
+        assert not isfile(cipher_file), "Output of cancelled job isn't removed!"
+
+        # Cancelling job itself
+        job = encrypt_file(cipher, plain_file, cipher_file, mode=MODE_BLOCK)
+        job.cancel()
+        try:
+            await job
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("Job isn't cancelled!")
+        assert not isfile(cipher_file), "Output of cancelled job isn't removed!"
+
+        # Only thread executors run file jobs
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(1) as executor:
+            try:
+                encrypt_file(cipher, plain_file, cipher_file, executor)
+            except AssertionError:
+                pass
+            else:
+                raise AssertionError("File job is started in process executor!")
+            prime = await generate_large_prime(128, executor=executor)
+        assert primes.is_prime(prime), "Generated number isn't prime!"
+
+    work_dir = tempfile.mkdtemp(prefix='elgamal_test_')
+    try:
+        cipher = encryption.ElGamal()
+        cipher.generate_keys(512)
+        asyncio.run(test(cipher, work_dir))
+    finally:
+        shutil.rmtree(work_dir)
+    print('All tests passed')
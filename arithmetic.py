@@ -0,0 +1,173 @@
+"""
+Big-integer arithmetic backends used by cipher and prime generation:
+modular power, modular inverse, probable prime test and random numbers.
+
+    * PythonBackend - CPython ints, modular power by fast_power.mod_power()
+    * Gmpy2Backend - GMP library through gmpy2 (optional dependency)
+
+Backend is selected by ARITHMETIC_BACKEND setting ('auto' is gmpy2 if it's
+installed, else python) or by set_backend() at runtime. Results are always
+returned as Python ints, so they can be mixed with other values freely.
+"""
+import secrets
+
+import ElGamalCipher.metrics as metrics
+from ElGamalCipher.fast_power import mod_power
+from ElGamalCipher.settings import ARITHMETIC_BACKEND
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class PythonBackend:
+    """
+    Pure Python arithmetic
+    """
+    name = 'python'
+    # Fixed-base power tables of Python ints are faster than power() of this backend
+    fixed_base_tables = True
+
+    @staticmethod
+    def power(base, exponent, modulus):
+        return mod_power(base, exponent, modulus)
+
+    @staticmethod
+    def inverse(value, modulus):
+        """
+        :return: value^-1 mod modulus, ValueError is raised if it doesn't exist
+        """
+        return pow(value, -1, modulus)
+
+    @staticmethod
+    def is_probable_prime(num, rounds=None, lucas=False):
+        """
+        Miller-Rabin's test (and strong Lucas test if lucas is True) without trial division
+        :param num: number to check
+        :param rounds: quantity of random witnesses (by default it depends on size of number)
+        :param lucas: if True, Baillie-PSW test is run
+        :return: True if number is probably prime
+        """
+        # primes module imports this module, so it's imported on the first call
+        from ElGamalCipher.primes import rabin_miller
+        return rabin_miller(num, rounds, lucas)
+
+    @staticmethod
+    def random_below(limit):
+        """
+        :return: cryptographically secure random number in range 0..limit-1
+        """
+        return secrets.randbelow(limit)
+
+    @staticmethod
+    def random_bits(bits):
+        """
+        :return: cryptographically secure random number with at most bits bits
+        """
+        return secrets.randbits(bits)
+
+
+class Gmpy2Backend(PythonBackend):
+    """
+    Arithmetic of GMP library. Random numbers are generated by Python, because
+    GMP generators aren't cryptographically secure
+    """
+    name = 'gmpy2'
+    fixed_base_tables = False
+
+    @staticmethod
+    def power(base, exponent, modulus):
+        return int(gmpy2.powmod(base, exponent, modulus))
+
+    @staticmethod
+    def inverse(value, modulus):
+        try:
+            return int(gmpy2.invert(value, modulus))
+        except ZeroDivisionError:
+            raise ValueError('base is not invertible for the given modulus')
+
+    @staticmethod
+    def is_probable_prime(num, rounds=None, lucas=False):
+        if num < 2:
+            return False
+        if lucas:
+            return bool(gmpy2.is_bpsw_prp(num))
+        if rounds is None:
+            from ElGamalCipher.primes import miller_rabin_rounds
+            rounds = miller_rabin_rounds(num.bit_length())
+        metrics.count('miller_rabin.rounds', rounds)
+        return bool(gmpy2.is_prime(num, rounds))
+
+
+BACKENDS = {PythonBackend.name: PythonBackend, Gmpy2Backend.name: Gmpy2Backend}
+_backend = PythonBackend
+
+
+def available_backends():
+    """
+    :return: list of names of backends that can be used
+    """
+    return [name for name in BACKENDS if name != Gmpy2Backend.name or gmpy2 is not None]
+
+
+def set_backend(name):
+    """
+    Selecting arithmetic backend
+    :param name: name of backend (see BACKENDS) or 'auto'
+    :return: selected backend
+    """
+    global _backend
+    if name == 'auto':
+        name = Gmpy2Backend.name if gmpy2 is not None else PythonBackend.name
+    assert name in BACKENDS, f"Unknown arithmetic backend: {name}"
+    assert name in available_backends(), f"Arithmetic backend {name} isn't available (gmpy2 is not installed)"
+    _backend = BACKENDS[name]
+    return _backend
+
+
+def get_backend():
+    return _backend
+
+
+def power(base, exponent, modulus):
+    """
+    :return: base^exponent mod modulus
+    """
+    metrics.count('modexp')
+    return _backend.power(base, exponent, modulus)
+
+
+def inverse(value, modulus):
+    """
+    :return: value^-1 mod modulus, ValueError is raised if it doesn't exist
+    """
+    return _backend.inverse(value, modulus)
+
+
+def is_probable_prime(num, rounds=None, lucas=False):
+    """
+    Probable prime test without trial division
+    :param num: number to check
+    :param rounds: quantity of Miller-Rabin's rounds (by default it depends on size of number)
+    :param lucas: if True, Baillie-PSW test is run
+    :return: True if number is probably prime
+    """
+    return _backend.is_probable_prime(num, rounds, lucas)
+
+
+def random_below(limit):
+    """
+    :return: random number in range 0..limit-1
+    """
+    return _backend.random_below(limit)
+
+
+def random_bits(bits):
+    """
+    :return: random number with at most bits bits
+    """
+    return _backend.random_bits(bits)
+
+
+set_backend(ARITHMETIC_BACKEND)
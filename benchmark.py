@@ -0,0 +1,355 @@
+"""
+Benchmark suite of cryptosystem: key generation, file encryption and
+decryption, primality helpers and modular power.
+
+Every case is run several times after warmup, fast cases are repeated in
+loop, so one run takes at least BENCHMARK_MIN_TIME seconds. Results are
+printed or saved as JSON and can be compared with stored baseline:
+
+    python -m ElGamalCipher.benchmark --output baseline.json
+    python -m ElGamalCipher.benchmark --compare baseline.json
+
+Compare mode exits with code 1 if any case became slower than baseline
+by more than threshold. Option --self-test checks measuring and compare
+mode on quick cases.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import ElGamalCipher.arithmetic as arithmetic
+import ElGamalCipher.encryption as encryption
+import ElGamalCipher.groups as groups
+import ElGamalCipher.primes as primes
+from ElGamalCipher.fast_power import FixedBasePower, POWER_BACKENDS, multi_power
+from ElGamalCipher.settings import BENCHMARK_WARMUP, BENCHMARK_REPEATS, BENCHMARK_MIN_TIME, BENCHMARK_THRESHOLD
+
+SUITES = ('keygen', 'cipher', 'primes', 'power')
+# Default KEY_SIZE is included, larger keys (e.g. --key-sizes 2048 3072) take minutes and are opt-in
+KEY_SIZES = (256, 512, 1024)
+PRIME_SIZES = (512, 1024, 2048)
+# Block mode of 1 MiB files (--file-sizes 1048576) takes minutes and is opt-in
+FILE_SIZES = (1024, 64 * 1024)
+CIPHER_MODES = (encryption.MODE_BLOCK, encryption.MODE_HYBRID)
+CIPHER_GROUP = 'ffdhe2048'
+
+
+def measure(func, warmup=BENCHMARK_WARMUP, repeats=BENCHMARK_REPEATS, min_time=BENCHMARK_MIN_TIME):
+    """
+    Measuring time of function call
+    :param func: function without arguments
+    :param warmup: quantity of runs before measuring
+    :param repeats: quantity of measured runs
+    :param min_time: min time of one run (in seconds), fast function is called several times per run
+    :return: dict with min, median, mean and stdev time of one call (in seconds) and quantity of calls per run
+    """
+    number = 1
+    for _ in range(warmup):
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+        if elapsed < min_time:
+            number = max(number, int(min_time / max(elapsed, 1e-9)) + 1)
+
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = perf_counter()
+            for _ in range(number):
+                func()
+            times.append((perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'number': number,
+        'repeats': repeats,
+    }
+
+
+def keygen_cases(key_sizes=KEY_SIZES):
+    """
+    Generating safe prime p, primitive root g and keys
+    :param key_sizes: sizes of p (in bits)
+    :return: generator of (name, function)
+    """
+    for key_size in key_sizes:
+        yield f'keygen/{key_size}', lambda key_size=key_size: encryption.ElGamal().generate_keys(key_size)
+
+
+def cipher_cases(work_dir, file_sizes=FILE_SIZES, modes=CIPHER_MODES, group=CIPHER_GROUP, cipher=None):
+    """
+    Encrypting and decrypting random files with fixed standard group keys.
+    Secret cache is cleared before every decryption, otherwise runs after
+    warmup would only read cached secrets
+    :param work_dir: directory for temporary files
+    :param file_sizes: sizes of plaintext files (in bytes)
+    :param modes: cipher modes
+    :param group: name of standard group used as domain parameters
+    :param cipher: ElGamal object to run cases with (new one with keys of group if None)
+    :return: generator of (name, function)
+    """
+    if cipher is None:
+        cipher = encryption.ElGamal()
+        cipher.generate_keys(group=group)
+    for size in file_sizes:
+        plaintext = os.path.join(work_dir, f'plain_{size}')
+        with open(plaintext, 'wb') as f:
+            f.write(os.urandom(size))
+        for mode in modes:
+            ciphertext = os.path.join(work_dir, f'cipher_{mode}_{size}')
+            decrypted = os.path.join(work_dir, f'decrypted_{mode}_{size}')
+            yield (f'cipher/{mode}/encrypt/{size}',
+                   lambda plaintext=plaintext, ciphertext=ciphertext, mode=mode:
+                   cipher.encrypt_file(plaintext, ciphertext, mode=mode))
+
+            def decrypt(ciphertext=ciphertext, decrypted=decrypted, mode=mode):
+                cipher.secret_cache.clear()
+                cipher.decrypt_file(ciphertext, decrypted, mode=mode)
+
+            yield f'cipher/{mode}/decrypt/{size}', decrypt
+
+
+def primes_cases(prime_sizes=PRIME_SIZES):
+    """
+    Primality helpers on fixed inputs: known primes and random odd composites
+    :param prime_sizes: sizes of numbers (in bits)
+    :return: generator of (name, function)
+    """
+    rand = random.Random(0)
+    for bits in prime_sizes:
+        prime = primes.generate_large_prime(bits)
+        composite = rand.getrandbits(bits) | (1 << (bits - 1)) | 1
+        while primes.is_prime(composite):
+            composite += 2
+        yield f'primes/is_prime/prime/{bits}', lambda prime=prime: primes.is_prime(prime)
+        yield f'primes/is_prime/composite/{bits}', lambda composite=composite: primes.is_prime(composite)
+        yield f'primes/rabin_miller/{bits}', lambda prime=prime: primes.rabin_miller(prime)
+        yield f'primes/generate_large_prime/{bits}', lambda bits=bits: primes.generate_large_prime(bits)
+
+    sieve_primes = primes.small_primes(primes.SIEVE_LIMIT)
+    start = rand.getrandbits(1024) | (1 << 1023) | 1
+    yield 'primes/sieve_window/1024', lambda: primes.sieve_window(start, primes.SIEVE_WINDOW, sieve_primes)
+    modulus = groups.get_group('ffdhe2048').p
+    values = [rand.randrange(1, modulus) for _ in range(1000)]
+    yield 'primes/batch_inverse/1000', lambda: primes.batch_inverse(values, modulus)
+
+
+def power_cases(group=CIPHER_GROUP):
+    """
+    Modular power with full-size exponent: every backend of mod_power(),
+    precomputed fixed-base table and product of two powers
+    :param group: name of standard group used as base and modulus
+    :return: generator of (name, function)
+    """
+    p, g = groups.get_group(group)
+    bits = p.bit_length()
+    rand = random.Random(0)
+    exponent, other_exponent = rand.randrange(2, p - 1), rand.randrange(2, p - 1)
+    other_base = rand.randrange(2, p - 1)
+    for name, backend in POWER_BACKENDS.items():
+        yield f'power/{name}/{bits}', lambda backend=backend: backend(g, exponent, p)
+    table = FixedBasePower(g, p, bits)
+    yield f'power/fixed_base/{bits}', lambda: table.power(exponent)
+    yield (f'power/two_powers/{bits}',
+           lambda: pow(g, exponent, p) * pow(other_base, other_exponent, p) % p)
+    yield (f'power/multi_power/{bits}',
+           lambda: multi_power((g, other_base), (exponent, other_exponent), p))
+
+
+def run(suites=SUITES, key_sizes=KEY_SIZES, prime_sizes=PRIME_SIZES, file_sizes=FILE_SIZES, modes=CIPHER_MODES,
+        warmup=BENCHMARK_WARMUP, repeats=BENCHMARK_REPEATS, min_time=BENCHMARK_MIN_TIME, log=None):
+    """
+    Running benchmark suites
+    :param suites: names of suites (see SUITES)
+    :param log: function called with name and result of every finished case
+    :return: dict with environment info ('meta') and results of cases ('results')
+    """
+    for suite in suites:
+        assert suite in SUITES, f"Unknown benchmark suite: {suite}"
+
+    work_dir = tempfile.mkdtemp(prefix='elgamal_benchmark_')
+    results = {}
+    try:
+        for suite in suites:
+            if suite == 'keygen':
+                cases = keygen_cases(key_sizes)
+            elif suite == 'cipher':
+                cases = cipher_cases(work_dir, file_sizes, modes)
+            elif suite == 'primes':
+                cases = primes_cases(prime_sizes)
+            else:
+                cases = power_cases()
+            for name, func in cases:
+                results[name] = measure(func, warmup, repeats, min_time)
+                if log:
+                    log(name, results[name])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': arithmetic.get_backend().name,
+            'warmup': warmup,
+            'repeats': repeats,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=BENCHMARK_THRESHOLD):
+    """
+    Comparing median times of cases with baseline
+    :param results: results returned by run()
+    :param baseline: results of previous run
+    :param threshold: allowed relative slowdown (0.1 is 10%)
+    :return: list of (name, baseline median, current median, ratio, is_regression) for cases present in both
+    """
+    rows = []
+    for name, result in results['results'].items():
+        if name in baseline['results']:
+            old = baseline['results'][name]['median']
+            ratio = result['median'] / old if old else float('inf')
+            rows.append((name, old, result['median'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.3f} {unit}'
+    return f'{seconds / 1e-9:.1f} ns'
+
+
+def self_test():
+    """
+    Checking measuring of quick cases and compare mode
+    :return: exit code
+    """
+    def result(median):
+        return {'median': median}
+
+    # Regression is only slowdown above threshold, cases missing in baseline are skipped
+    results = {'results': {'same': result(1.0), 'faster': result(0.5), 'slower': result(1.2),
+                           'new': result(1.0), 'zero': result(1.0)}}
+    baseline = {'results': {'same': result(1.0), 'faster': result(1.0), 'slower': result(1.0),
+                            'zero': result(0.0), 'removed': result(1.0)}}
+    rows = {name: (ratio, is_regression) for name, _, _, ratio, is_regression in compare(results, baseline, 0.1)}
+    assert set(rows) == {'same', 'faster', 'slower', 'zero'}, f"Unexpected compared cases: {sorted(rows)}"
+    assert rows['same'] == (1.0, False) and rows['faster'] == (0.5, False), "Not slower case is regression!"
+    assert rows['slower'][1] and rows['zero'] == (float('inf'), True), "Slower case isn't regression!"
+    assert not compare(results, baseline, 0.25)[2][4], "Slowdown below threshold is regression!"
+
+    # Decryption isn't served by secret cache after warmup
+    work_dir = tempfile.mkdtemp(prefix='elgamal_benchmark_')
+    try:
+        cipher = encryption.ElGamal()
+        cipher.generate_keys(group=CIPHER_GROUP)
+        cases = dict(cipher_cases(work_dir, (1024,), (encryption.MODE_BLOCK,), cipher=cipher))
+        cases['cipher/block/encrypt/1024']()
+        for _ in range(2):
+            cases['cipher/block/decrypt/1024']()
+        assert not cipher.secret_cache.hits, "Decryption reads cached secrets!"
+    finally:
+        shutil.rmtree(work_dir)
+
+    # Compare mode exits with 1 if case is slower than baseline
+    work_dir = tempfile.mkdtemp(prefix='elgamal_benchmark_')
+    try:
+        baseline_file = os.path.join(work_dir, 'baseline.json')
+        args = ['--suite', 'power', '--warmup', '1', '--repeats', '2', '--min-time', '0']
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            assert main(args + ['--output', baseline_file]) == 0, "Benchmark run failed!"
+            with open(baseline_file) as f:
+                baseline = json.load(f)
+            assert baseline['results'] and all(result['repeats'] == 2 for result in baseline['results'].values())
+            for result in baseline['results'].values():
+                result['median'] /= 100
+            with open(baseline_file, 'w') as f:
+                json.dump(baseline, f)
+            assert main(args + ['--compare', baseline_file]) == 1, "Regression isn't reported!"
+            assert main(args + ['--compare', baseline_file, '--threshold', '1000']) == 0, "Regression is reported!"
+    finally:
+        shutil.rmtree(work_dir)
+
+    print('All tests passed')
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m ElGamalCipher.benchmark',
+                                     description='Benchmarks of ElGamal cryptosystem')
+    parser.add_argument('--suite', nargs='+', choices=SUITES, default=list(SUITES), help='suites to run')
+    parser.add_argument('--key-sizes', nargs='+', type=int, default=list(KEY_SIZES),
+                        help='key sizes (in bits) of key generation (e.g. 2048 3072 for large keys)')
+    parser.add_argument('--prime-sizes', nargs='+', type=int, default=list(PRIME_SIZES),
+                        help='sizes (in bits) of numbers tested by primality helpers')
+    parser.add_argument('--file-sizes', nargs='+', type=int, default=list(FILE_SIZES),
+                        help='sizes (in bytes) of encrypted files')
+    parser.add_argument('--modes', nargs='+', choices=list(encryption.MODE_CODES), default=list(CIPHER_MODES),
+                        help='cipher modes')
+    parser.add_argument('--backend', choices=arithmetic.available_backends(),
+                        default=arithmetic.get_backend().name, help='arithmetic backend')
+    parser.add_argument('--warmup', type=int, default=BENCHMARK_WARMUP, help='runs before measuring')
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_REPEATS, help='measured runs')
+    parser.add_argument('--min-time', type=float, default=BENCHMARK_MIN_TIME,
+                        help='min time (in seconds) of one measured run')
+    parser.add_argument('--output', help='path to save JSON results (printed if not set)')
+    parser.add_argument('--compare', metavar='BASELINE', help='path to JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD,
+                        help='allowed relative slowdown in compare mode')
+    parser.add_argument('--self-test', action='store_true', help='check measuring and compare mode, then exit')
+    args = parser.parse_args(args)
+    if args.self_test:
+        return self_test()
+    assert args.repeats > 0, "Quantity of repeats must be positive!"
+    arithmetic.set_backend(args.backend)
+
+    def log(name, result):
+        print(f'{name:<40} {format_time(result["median"]):>12} ± {format_time(result["stdev"])}', file=sys.stderr)
+
+    # Debug messages of cipher mustn't be mixed with JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.suite, args.key_sizes, args.prime_sizes, args.file_sizes, args.modes,
+                      args.warmup, args.repeats, args.min_time, log)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, old, new, ratio, is_regression in compare(results, baseline, args.threshold):
+            regressions += is_regression
+            mark = 'REGRESSION' if is_regression else ''
+            print(f'{name:<40} {format_time(old):>12} -> {format_time(new):>12} {ratio:6.2f}x {mark}')
+        print(f'{regressions} regression(s) with threshold {args.threshold:.0%}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,42 +1,124 @@
+import ElGamalCipher.metrics as metrics
 from ElGamalCipher.settings import DEBUG
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bits of every byte value, used to render bytes without per-bit loops
+_BYTE_BITS = [format(byte, '08b') for byte in range(256)]
+# Shorter data is rendered with lookup table, because NumPy call overhead is bigger
+NUMPY_MIN_BYTES = 256
+
 
 def debug_message(message):
     """
-    Printing debug message if DEBUG mode is enabled
+    Recording debug message as metrics event and printing it if DEBUG mode is enabled
     :param message:
     :return:
     """
+    metrics.event(str(message))
     if DEBUG:
         print(f'[DEBUG] {message}')
 
 
-def get_file_bits(src_file, num_of_bits):
+class JobCancelled(Exception):
     """
-    Function that represents file as sequence of bits
-    :param src_file: path to selected file
-    :param num_of_bits: quantity of bits needed to return
-    :return: string that consists list of :num_of_bits: bits
+    Raised while reading input of cancelled job
+    """
+
+
+class ProgressReader:
     """
-    def _convert_byte_to_bits(_byte):
+    Wrapper of binary file-like object that reports quantity of read bytes
+    and stops reading if job is cancelled
+    """
+
+    def __init__(self, reader, on_read=None, is_cancelled=None):
         """
-        Converts byte to string that consists sequence of bits
-        :param _byte:
-        :return: sequence of bits
+        :param reader: binary file-like object
+        :param on_read: function called with quantity of bytes after every read
+        :param is_cancelled: function that returns True if job is cancelled
         """
-        _list_of_bits = []
-        for _ in range(8):
-            _list_of_bits.append(str(_byte & 1))
-            _byte >>= 1
-        return ''.join(list(reversed(_list_of_bits)))
-
-    _num_of_bits = 0
-    list_of_bits = []
-    file_byte = 1
+        self.reader = reader
+        self.on_read = on_read
+        self.is_cancelled = is_cancelled
+
+    def read(self, size=-1):
+        if self.is_cancelled and self.is_cancelled():
+            raise JobCancelled()
+        data = self.reader.read(size)
+        if self.on_read:
+            self.on_read(len(data))
+        return data
+
+
+def bytes_to_bits(data):
+    """
+    Function that represents bytes as sequence of bits
+    :param data: bytes-like object
+    :return: string of 8-bit groups separated by spaces
+    """
+    if numpy is not None and len(data) >= NUMPY_MIN_BYTES:
+        # Every byte becomes 8 ASCII digits and space, the last space is dropped
+        bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8)).reshape(-1, 8)
+        text = numpy.full((len(bits), 9), ord(' '), dtype=numpy.uint8)
+        text[:, :8] = bits + ord('0')
+        return text.tobytes()[:-1].decode('ascii')
+    return ' '.join(map(_BYTE_BITS.__getitem__, data))
+
+
+def get_file_bits(src_file, num_of_bits, offset=0):
+    """
+    Function that represents file as sequence of bits
+    :param src_file: path to selected file
+    :param num_of_bits: quantity of bits needed to return (rounded up to whole bytes)
+    :param offset: position (in bytes) of the first byte to return
+    :return: string of 8-bit groups separated by spaces
+    """
     with open(src_file, 'rb') as f:
-        while _num_of_bits < num_of_bits and file_byte:
-            file_byte = f.read(1)
-            if file_byte:
-                list_of_bits.append(_convert_byte_to_bits(file_byte[0]))
-            _num_of_bits += 8
-    return ' '.join(list_of_bits)
+        f.seek(offset)
+        data = f.read((num_of_bits + 7) // 8) if num_of_bits > 0 else b''
+    return bytes_to_bits(data)
+
+
+if __name__ == '__main__':
+    # Bits rendering (lookup table and NumPy) and progress reader tests
+    import io
+    import os
+    import tempfile
+
+    for size in (0, 1, NUMPY_MIN_BYTES - 1, NUMPY_MIN_BYTES, 1000):
+        data = os.urandom(size)
+        expected = ' '.join(format(byte, '08b') for byte in data)
+        assert bytes_to_bits(data) == expected, f"Wrong bits of {size} bytes!"
+        assert bytes_to_bits(bytearray(data)) == expected, f"Wrong bits of {size} bytes (bytearray)!"
+        if numpy is not None:
+            numpy_module, numpy = numpy, None
+            assert bytes_to_bits(data) == expected, f"Wrong bits of {size} bytes (lookup table)!"
+            numpy = numpy_module
+    if numpy is None:
+        print('NumPy is not installed, only lookup table is tested')
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(bytes(range(256)))
+    try:
+        assert get_file_bits(f.name, 9, offset=1) == '00000001 00000010', "Bits aren't rounded up to bytes!"
+        assert get_file_bits(f.name, 0) == '', "Bits of empty range aren't empty!"
+        assert get_file_bits(f.name, 16, offset=255) == '11111111', "Bits after end of file are returned!"
+    finally:
+        os.remove(f.name)
+
+    read_sizes = []
+    cancelled = False
+    reader = ProgressReader(io.BytesIO(b'x' * 10), read_sizes.append, lambda: cancelled)
+    assert reader.read(4) == b'xxxx' and reader.read() == b'x' * 6 and read_sizes == [4, 6], "Wrong reported sizes!"
+    cancelled = True
+    try:
+        reader.read(1)
+    except JobCancelled:
+        pass
+    else:
+        raise AssertionError("Cancelled job reads input!")
+    print('All tests passed')
@@ -1,14 +1,116 @@
+import hmac
+import struct
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from hashlib import sha256, shake_256
+from itertools import islice
+from os import O_CREAT, O_TRUNC, O_WRONLY, cpu_count, makedirs, open as os_open, remove
 from os.path import isfile
 
+import ElGamalCipher.arithmetic as arithmetic
+import ElGamalCipher.groups as groups
+import ElGamalCipher.metrics as metrics
 import ElGamalCipher.primes as primes
-from ElGamalCipher.settings import DEFAULT_KEY_PATH
-from ElGamalCipher.core import debug_message
+from ElGamalCipher.fast_power import FixedBasePower
+from ElGamalCipher.settings import (DEFAULT_KEY_PATH, KEY_SIZE, KEY_PROFILE, SUBGROUP_BITS, CIPHER_MODE,
+                                    SECRET_CACHE_SIZE, FIXED_BASE_WINDOW, FIXED_BASE_MAX_MEMORY, FIXED_BASE_MIN_USES,
+                                    STREAM_CHUNK_SIZE, WORKERS, PARALLEL_QUEUE_FACTOR)
+from ElGamalCipher.core import debug_message, ProgressReader
+
+# Cipher modes: every byte as separate message, bytes packed into blocks or
+# hybrid mode, where ElGamal encrypts only random secret of symmetric cipher
+MODE_BYTE = 'byte'
+MODE_BLOCK = 'block'
+MODE_HYBRID = 'hybrid'
+
+MODE_CODES = {MODE_BYTE: 0, MODE_BLOCK: 1, MODE_HYBRID: 2}
+
+# Key profiles: private and session keys are random up to p, or they are
+# short and g generates subgroup of prime order q (q is kept in public key)
+KEY_PROFILE_FULL = 'full'
+KEY_PROFILE_SUBGROUP = 'subgroup'
+
+# Order of public key values in public key file
+PUBLIC_KEY_VALUES = ('p', 'g', 'y', 'q')
+
+# Padding marker of the last block (ISO/IEC 7816-4): 0x80 followed by zero bytes
+BLOCK_PADDING = b'\x80'
+
+# Binary ciphertext file: header (magic, format version, key size in bits,
+# block size in bytes, cipher mode code) and fixed-width big-endian records
+# of alpha and beta, each record value takes (key size + 7) // 8 bytes
+FILE_MAGIC = b'EGCF'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('>4sBHHB')
+
+# Hybrid mode file: header, one record with encrypted secret, payload XORed
+# with SHAKE-256 keystream (generated by segments) and HMAC-SHA256 tag
+HYBRID_SEGMENT_SIZE = 64 * 1024
+HYBRID_TAG_SIZE = 32
+
+
+class SecretCache:
+    """
+    Bounded LRU cache of alpha -> inverse shared secret ((alpha^x)^-1 mod p).
+    Files encrypted with shared session key (legacy files and byte mode
+    without fresh session) reuse the same alpha for many records, so
+    decryption needs only one exponentiation per distinct alpha
+    """
+
+    def __init__(self, max_size=SECRET_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._secrets = OrderedDict()
+
+    def __len__(self):
+        return len(self._secrets)
+
+    def lookup(self, alpha):
+        """
+        Getting cached inverse shared secret for alpha
+        :param alpha: first part of ciphertext record (g^k mod p)
+        :return: (alpha^x)^-1 mod p or None if it isn't cached
+        """
+        secret = self._secrets.get(alpha)
+        if secret is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._secrets.move_to_end(alpha)
+        return secret
+
+    def put(self, alpha, secret):
+        """
+        Saving inverse shared secret for alpha, the least recently used value
+        is removed if cache is full
+        :param alpha: first part of ciphertext record (g^k mod p)
+        :param secret: (alpha^x)^-1 mod p
+        :return: None
+        """
+        if self.max_size > 0:
+            self._secrets[alpha] = secret
+            if len(self._secrets) > self.max_size:
+                self._secrets.popitem(last=False)
+
+    def clear(self):
+        """
+        Removing all cached values and resetting counters
+        :return: None
+        """
+        self._secrets.clear()
+        self.hits = 0
+        self.misses = 0
 
 
 class ElGamal:
     def __init__(self, keys=None):
         self.keys = keys
         self.is_keys_configured = False
+        self.secret_cache = SecretCache()
+        self._fixed_bases = {}
+        self._fixed_base_uses = {}
 
     def set_keys(self, keys=None):
         """
@@ -18,65 +120,311 @@ class ElGamal:
         """
         self.keys = keys
         self.is_keys_configured = True
+        # Cached secrets and tables are valid only for the keys they were calculated with
+        self.secret_cache.clear()
+        self._fixed_bases = {}
+        self._fixed_base_uses = {}
         return self.keys
 
+    def generate_keys(self, key_size=KEY_SIZE, parameter_pool=None, group=None, profile=KEY_PROFILE):
+        """
+        Generating and setting new keys
+        :param key_size: size of p (in bits)
+        :param parameter_pool: ParameterPool to take domain parameters (p, g) from,
+                               if it's not set, they are generated (pool isn't used by subgroup profile)
+        :param group: name of standard group (see groups.GROUPS) to use as domain
+                      parameters instead of generating them, key_size is ignored
+        :param profile: KEY_PROFILE_FULL or KEY_PROFILE_SUBGROUP
+        :return: keys
+        """
+        assert profile in (KEY_PROFILE_FULL, KEY_PROFILE_SUBGROUP), f"Unknown key profile: {profile}"
+        with metrics.span('keygen', key_size=key_size, group=group, profile=profile):
+            public = {}
+            if group is not None:
+                p, g = groups.get_group(group)
+                if profile == KEY_PROFILE_SUBGROUP:
+                    # Generator of standard group generates subgroup of order (p - 1) / 2
+                    public['q'] = (p - 1) // 2
+            elif profile == KEY_PROFILE_SUBGROUP:
+                p, public['q'], g = primes.generate_subgroup_parameters(key_size, SUBGROUP_BITS)
+            elif parameter_pool is None:
+                p = primes.generate_safe_prime(key_size)
+                g = primes.primitive_roots(p)
+            else:
+                p, g = parameter_pool.get(key_size)
+            public.update({'p': p, 'g': g})
+
+            bound = self.exponent_bound(public)
+            x = arithmetic.random_below(bound - 3) + 3
+            public['y'] = arithmetic.power(g, x, p)
+            return self.set_keys({
+                'public': public,
+                'private': x,
+                'session': arithmetic.random_below(bound - 2) + 2
+            })
+
+    @staticmethod
+    def exponent_bound(public):
+        """
+        Calculating upper bound of random private and session keys: p - 1 for
+        full profile, order q of subgroup (but not more than 2^SUBGROUP_BITS)
+        for subgroup profile
+        :param public: public key
+        :return: bound of keys
+        """
+        q = public.get('q')
+        if q is None:
+            return public['p'] - 1
+        return min(q, 1 << SUBGROUP_BITS)
+
+    def encryption_mode(self, mode=None):
+        """
+        Checking if keys can encrypt in cipher mode. Messages aren't mapped
+        into subgroup of order q, so with keys of subgroup profile beta^q = m^q
+        would reveal every message of byte or block mode without private key.
+        Hybrid mode encrypts only secret from subgroup, so it's always allowed
+        :param mode: cipher mode, None is CIPHER_MODE (hybrid mode for subgroup profile)
+        :return: cipher mode
+        """
+        is_subgroup = 'q' in self.keys['public']
+        if mode is None:
+            mode = MODE_HYBRID if is_subgroup else CIPHER_MODE
+        assert mode in MODE_CODES, f"Unknown cipher mode: {mode}"
+        assert mode == MODE_HYBRID or not is_subgroup, "Keys of subgroup profile can encrypt only in hybrid mode!"
+        return mode
+
     def save_keys(self, save_path=DEFAULT_KEY_PATH):
         """
-        Saving encryption keys to file
+        Saving encryption keys to file. Private key is saved to id_elgamal
+        (readable only by owner), public key values p, g, y (and q of subgroup
+        profile) are saved to id_elgamal.pub, one per line
         :param save_path: path to save keys
         :return: 1 if saving successful else 0
         """
         try:
-            with open(f'{save_path}/id_elgamal', 'w') as f:
-                f.write(self.keys['private'])
+            makedirs(save_path, exist_ok=True)
+            with open(os_open(f'{save_path}/id_elgamal', O_WRONLY | O_CREAT | O_TRUNC, 0o600), 'w') as f:
+                f.write(f"{self.keys['private']}\n")
             with open(f'{save_path}/id_elgamal.pub', 'w') as f:
-                f.write(self.keys['public']['p'] + '\n')
-                f.write(self.keys['public']['g'] + '\n')
-                f.write(self.keys['public']['y'] + '\n')
+                for name in PUBLIC_KEY_VALUES:
+                    if name in self.keys['public']:
+                        f.write(f"{self.keys['public'][name]}\n")
             debug_message('Saving complete!')
             return 1
-        except Exception:
-            debug_message(f'Saving error! ({Exception})')
+        except (OSError, KeyError, TypeError) as e:
+            debug_message(f'Saving error! ({e})')
             return 0
 
-    def load_keys(self, load_path=DEFAULT_KEY_PATH):
+    def load_keys(self, load_path=DEFAULT_KEY_PATH, private=True):
         """
-        Loading keys from file
+        Loading keys from file and setting them, new session key is generated
         :param load_path: path that includes files with keys
+        :param private: if False, only public key is loaded (enough to encrypt)
         :return: dict with keys if successful else 0
         """
         try:
-            with open(f'{load_path}/id_elgamal', 'r') as f:
-                f.read(self.keys['private'])
             with open(f'{load_path}/id_elgamal.pub', 'r') as f:
-                self.keys['public']['p'] = f.readline()
-                self.keys['public']['g'] = f.readline()
-                self.keys['public']['y'] = f.readline()
+                values = [int(line) for line in f if line.strip()]
+            assert 3 <= len(values) <= len(PUBLIC_KEY_VALUES), "Public key file is damaged!"
+            x = None
+            if private:
+                with open(f'{load_path}/id_elgamal', 'r') as f:
+                    x = int(f.read())
+            self.set_keys({
+                'public': dict(zip(PUBLIC_KEY_VALUES, values)),
+                'private': x,
+                'session': None
+            })
+            self.keys['session'] = self.generate_session_key()
             debug_message('Loading successful!')
             return self.keys
-        except FileNotFoundError:
-            debug_message(f'Loading error! ({FileNotFoundError})')
+        except (OSError, ValueError, AssertionError) as e:
+            debug_message(f'Loading error! ({e})')
             return 0
 
     @staticmethod
-    def _open_file_binary(filename):
+    def _read_exactly(reader, size):
         """
-        Reading file byte to byte
-        :param filename: path to file to read
-        :return: generator of file bytes as integer values
+        Reading exactly size bytes from stream (less only at the end of stream)
+        :param reader: binary file-like object
+        :param size: quantity of bytes to read
+        :return: read bytes
         """
-        for _byte in open(filename, 'rb').read():
-            yield _byte
+        data = b''
+        while len(data) < size:
+            chunk = reader.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
 
     @staticmethod
-    def _open_file_longint(filename):
+    def _read_chunks(reader, chunk_size, multiple=1):
         """
-        Reading long integer bytes from file
-        :param filename:
-        :return:
+        Reading stream by chunks, size of every chunk is a multiple of
+        :multiple: (except the last one)
+        :param reader: binary file-like object
+        :param chunk_size: max size of chunk (in bytes)
+        :param multiple: size of chunk is rounded to multiple of this value
+        :return: generator of chunks as bytes
         """
-        for num in open(filename, 'r').readlines():
-            yield int(num)
+        chunk_size = max(multiple, chunk_size // multiple * multiple)
+        rest = b''
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            if rest:
+                chunk = rest + chunk
+            # Pipes and sockets can return less than requested
+            end = len(chunk) - len(chunk) % multiple
+            rest = chunk[end:]
+            if end:
+                yield chunk[:end]
+        if rest:
+            yield rest
+
+    def _read_plaintext_chunks(self, reader, mode):
+        """
+        Reading plaintext stream by chunks of whole blocks. The last chunk
+        is marked to be padded
+        :param reader: binary file-like object
+        :param mode: cipher mode
+        :return: generator of (chunk, is_last) pairs
+        """
+        multiple = self.block_size() if mode == MODE_BLOCK else 1
+        chunks = self._read_chunks(reader, STREAM_CHUNK_SIZE, multiple)
+        chunk = next(chunks, b'')
+        for next_chunk in chunks:
+            yield chunk, False
+            chunk = next_chunk
+        yield chunk, True
+
+    def _read_longints(self, reader, head=b''):
+        """
+        Reading long integers from legacy text ciphertext stream (one number per line)
+        :param reader: binary file-like object
+        :param head: bytes that were already read from stream
+        :return: generator of integers
+        """
+        rest = head
+        for chunk in self._read_chunks(reader, STREAM_CHUNK_SIZE):
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            yield from self._parse_longints(lines)
+        yield from self._parse_longints(rest.split(b'\n'))
+
+    @staticmethod
+    def _parse_longints(lines):
+        """
+        Parsing lines of legacy text ciphertext, empty lines are skipped
+        :param lines: list of lines as bytes
+        :return: generator of integers
+        """
+        for line in lines:
+            if line.strip():
+                try:
+                    yield int(line)
+                except ValueError:
+                    raise AssertionError("File is damaged! Text file includes not only numbers.")
+
+    @staticmethod
+    def _pair_records(numbers):
+        """
+        Grouping numbers of legacy text ciphertext into records
+        :param numbers: iterator of integers
+        :return: generator of (alpha, beta) pairs
+        """
+        for alpha in numbers:
+            beta = next(numbers, None)
+            assert beta is not None, "File is damaged! Last record is incomplete."
+            yield alpha, beta
+
+    @staticmethod
+    def _unpad_block(block):
+        """
+        Removing padding from the last decrypted block
+        :param block: last block with padding
+        :return: block without padding
+        """
+        block = block.rstrip(b'\x00')
+        assert block.endswith(BLOCK_PADDING), "Wrong padding! File is damaged or keys are incorrect."
+        return block[:-len(BLOCK_PADDING)]
+
+    def _pack_header(self, mode):
+        """
+        Packing header of binary ciphertext file
+        :param mode: cipher mode used to encrypt file
+        :return: header bytes
+        """
+        return FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.keys['public']['p'].bit_length(),
+                                self.block_size(), MODE_CODES[mode])
+
+    def _unpack_header(self, header):
+        """
+        Unpacking and checking header of binary ciphertext file
+        :param header: FILE_HEADER.size bytes from the beginning of file
+        :return: cipher mode used to encrypt file
+        """
+        assert len(header) == FILE_HEADER.size, "File header is damaged!"
+        magic, version, key_size, block_size, mode_code = FILE_HEADER.unpack(header)
+        assert magic == FILE_MAGIC, "File is not encrypted with ElGamal cipher!"
+        assert version == FILE_VERSION, f"Unsupported file format version: {version}"
+        assert key_size == self.keys['public']['p'].bit_length() and block_size == self.block_size(), \
+            "File was encrypted with another key!"
+        modes = {code: mode for mode, code in MODE_CODES.items()}
+        assert mode_code in modes, f"Unknown cipher mode code: {mode_code}"
+        return modes[mode_code]
+
+    def record_width(self):
+        """
+        Calculating size of alpha or beta value in binary ciphertext file
+        :return: size of value (in bytes)
+        """
+        return (self.keys['public']['p'].bit_length() + 7) // 8
+
+    def block_size(self):
+        """
+        Calculating how many bytes fit into one message integer. Message is
+        stored as block value + 1, so it's always in range 1..p-1
+        :return: size of block (in bytes)
+        """
+        return (self.keys['public']['p'].bit_length() - 1) // 8
+
+    def fixed_base_power(self, base_name, exponent):
+        """
+        Calculating power of public key value (g or y). Building table of
+        precomputed powers costs about as much as FIXED_BASE_MIN_USES powers,
+        so it's built only after so many powers of the same base (and never
+        for backends that are faster without it)
+        :param base_name: 'g' or 'y'
+        :param exponent: power to raise base to
+        :return: base^exponent mod p
+        """
+        table = self._fixed_bases.get(base_name)
+        if table is None:
+            p = self.keys['public']['p']
+            uses = self._fixed_base_uses.get(base_name, 0) + 1
+            self._fixed_base_uses[base_name] = uses
+            if uses <= FIXED_BASE_MIN_USES or not arithmetic.get_backend().fixed_base_tables:
+                return arithmetic.power(self.keys['public'][base_name], exponent, p)
+            # Window is reduced if table of large key doesn't fit into memory limit
+            # Short keys of subgroup profile need table only for their size
+            max_bits = self.exponent_bound(self.keys['public']).bit_length()
+            window = FIXED_BASE_WINDOW
+            while window > 1 and FixedBasePower.memory_size(max_bits, window) > FIXED_BASE_MAX_MEMORY:
+                window -= 1
+            table = FixedBasePower(self.keys['public'][base_name], p, max_bits, window)
+            self._fixed_bases[base_name] = table
+        metrics.count('modexp.fixed_base')
+        return table.power(exponent)
+
+    def generate_session_key(self):
+        """
+        Generating random session key for one record
+        :return: session key k in range 2..p-2 (or 2..q-1 for subgroup profile)
+        """
+        return arithmetic.random_below(self.exponent_bound(self.keys['public']) - 2) + 2
 
     def encrypt_byte(self, _byte):
         """
@@ -84,41 +432,361 @@ class ElGamal:
         :param _byte: byte to encrypt
         :return: encrypted byte
         """
-        beta = (pow(self.keys['public']['y'], self.keys['session'], self.keys['public']['p'])
+        beta = (self.fixed_base_power('y', self.keys['session'])
                 * (_byte % self.keys['public']['p'])) % self.keys['public']['p']
         return beta
 
-    def encrypt_file(self, input_file_name='', output_file_name=''):
+    def encrypt_chunk(self, chunk, mode=CIPHER_MODE, fresh_session=True, is_last=True):
+        """
+        Encrypts chunk of plaintext to binary ciphertext records. In block
+        mode the last chunk is padded with 0x80 byte followed by zero bytes,
+        so padding block is added even if its size is a multiple of block size.
+        Block mode always uses new session key for every record: padding block
+        can be fully known, and with shared session key it would reveal y^k
+        and so all other blocks
+        :param chunk: plaintext bytes (whole blocks if it's not the last chunk)
+        :param mode: cipher mode
+        :param fresh_session: if True, new random session key is used for every record,
+                              if False, session key of keys is used (only in byte mode)
+        :param is_last: True if chunk is the end of plaintext
+        :return: ciphertext records as bytes
+        """
+        p = self.keys['public']['p']
+        width = self.record_width()
+        if mode == MODE_BYTE:
+            messages = chunk
+        else:
+            block_size = self.block_size()
+            if is_last:
+                chunk += BLOCK_PADDING + bytes(block_size - len(chunk) % block_size - 1)
+            messages = (int.from_bytes(chunk[i:i + block_size], 'big') + 1
+                        for i in range(0, len(chunk), block_size))
+
+        fresh_session = fresh_session or mode == MODE_BLOCK
+        if not fresh_session:
+            alpha_bytes = self.fixed_base_power('g', self.keys['session']).to_bytes(width, 'big')
+            shared_secret = self.fixed_base_power('y', self.keys['session'])
+        output = bytearray()
+        for message in messages:
+            if fresh_session:
+                session = self.generate_session_key()
+                alpha_bytes = self.fixed_base_power('g', session).to_bytes(width, 'big')
+                shared_secret = self.fixed_base_power('y', session)
+            output += alpha_bytes
+            output += (shared_secret * message % p).to_bytes(width, 'big')
+        return bytes(output)
+
+    def decrypt_batch(self, records):
+        """
+        Decrypts batch of records to message integers. Shared secrets
+        alpha^x of all distinct alphas that aren't cached are inverted
+        together (Montgomery's trick), so batch needs only one modular
+        inversion
+        :param records: iterable of (alpha, beta) pairs
+        :return: list of messages
+        """
+        records = list(records)
+        x = self.keys['private']
+        p = self.keys['public']['p']
+
+        inverses = {}
+        missing = []
+        for alpha, _ in records:
+            if alpha not in inverses:
+                assert 0 < alpha < p, "Wrong alpha value! File is damaged or keys are incorrect."
+                inverses[alpha] = self.secret_cache.lookup(alpha)
+                if inverses[alpha] is None:
+                    missing.append(alpha)
+
+        shared_secrets = [arithmetic.power(alpha, x, p) for alpha in missing]
+        for alpha, inverse in zip(missing, primes.batch_inverse(shared_secrets, p)):
+            inverses[alpha] = inverse
+            self.secret_cache.put(alpha, inverse)
+
+        return [beta * inverses[alpha] % p for alpha, beta in records]
+
+    def _decrypt_records(self, records, mode):
+        """
+        Decrypts (alpha, beta) records. Padding of the last block isn't removed
+        :param records: iterable of (alpha, beta) pairs
+        :param mode: cipher mode
+        :return: plaintext bytes
+        """
+        block_size = self.block_size()
+        output = bytearray()
+        for message in self.decrypt_batch(records):
+            try:
+                if mode == MODE_BYTE:
+                    output.append(message)
+                else:
+                    output += (message - 1).to_bytes(block_size, 'big')
+            except (ValueError, OverflowError):
+                raise AssertionError("Wrong block value! File is damaged or keys are incorrect.")
+        return bytes(output)
+
+    def decrypt_chunk(self, chunk, mode=CIPHER_MODE):
+        """
+        Decrypts chunk of binary ciphertext records. Padding of the last block isn't removed
+        :param chunk: ciphertext records as bytes (without header)
+        :param mode: cipher mode
+        :return: plaintext bytes
+        """
+        width = self.record_width()
+        assert len(chunk) % (2 * width) == 0, "File is damaged! Last record is incomplete."
+        records = ((int.from_bytes(chunk[i:i + width], 'big'),
+                    int.from_bytes(chunk[i + width:i + 2 * width], 'big'))
+                   for i in range(0, len(chunk), 2 * width))
+        return self._decrypt_records(records, mode)
+
+    def _map_chunks(self, method_name, tasks, workers):
+        """
+        Running cipher method for every task, in worker processes if workers > 1.
+        Results are returned in order of tasks, quantity of tasks in progress
+        is limited, so input is read only as fast as results are written
+        :param method_name: name of ElGamal method to run
+        :param tasks: iterable of method arguments tuples
+        :param workers: quantity of worker processes (0 or None is quantity of CPUs)
+        :return: generator of results
+        """
+        workers = workers or cpu_count() or 1
+        if workers == 1:
+            method = getattr(self, method_name)
+            for args in tasks:
+                yield method(*args)
+            return
+
+        in_flight = deque()
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(self.keys, arithmetic.get_backend().name)) as executor:
+            try:
+                for args in tasks:
+                    in_flight.append(executor.submit(_run_worker, method_name, *args))
+                    if len(in_flight) >= workers * PARALLEL_QUEUE_FACTOR:
+                        yield in_flight.popleft().result()
+                while in_flight:
+                    yield in_flight.popleft().result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def _write_plaintext(self, pieces, writer, mode):
+        """
+        Writing decrypted pieces of plaintext and removing padding of the last block
+        :param pieces: iterable of plaintext bytes
+        :param writer: binary file-like object
+        :param mode: cipher mode
+        :return: None
+        """
+        # The last piece is kept until the end of stream to remove its padding
+        last_piece = None
+        for piece in pieces:
+            if last_piece is not None:
+                writer.write(last_piece)
+            last_piece = piece
+
+        if last_piece is None:
+            # Empty plaintext is encrypted to zero records only in byte mode, block mode always adds padding block
+            assert mode == MODE_BYTE, "File is damaged! Padding block is missing."
+            return
+        if mode == MODE_BLOCK:
+            block_size = self.block_size()
+            last_piece = last_piece[:-block_size] + self._unpad_block(last_piece[-block_size:])
+        writer.write(last_piece)
+
+    def _hybrid_keys(self, secret):
+        """
+        Deriving keys of symmetric cipher and MAC from encrypted secret
+        :param secret: random secret encrypted with ElGamal
+        :return: symmetric cipher key and MAC key
+        """
+        secret_bytes = secret.to_bytes(self.record_width(), 'big')
+        return (sha256(b'ElGamal hybrid encryption key' + secret_bytes).digest(),
+                sha256(b'ElGamal hybrid authentication key' + secret_bytes).digest())
+
+    @staticmethod
+    def _hybrid_xor(key, offset, data):
+        """
+        XORing data with keystream. Keystream segment i is SHAKE-256(key || i),
+        so any part of stream can be processed independently
+        :param key: symmetric cipher key
+        :param offset: position of data in stream (multiple of HYBRID_SEGMENT_SIZE)
+        :param data: bytes to encrypt or decrypt
+        :return: XORed bytes
+        """
+        first_segment = offset // HYBRID_SEGMENT_SIZE
+        segments = (len(data) + HYBRID_SEGMENT_SIZE - 1) // HYBRID_SEGMENT_SIZE
+        keystream = b''.join(shake_256(key + i.to_bytes(8, 'big')).digest(HYBRID_SEGMENT_SIZE)
+                             for i in range(first_segment, first_segment + segments))
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream[:len(data)], 'big')).to_bytes(len(data), 'big')
+
+    def _encrypt_hybrid(self, reader, writer, header):
+        """
+        Encrypts stream in hybrid mode: random secret g^s is encrypted with
+        ElGamal (using new session key), payload is encrypted with symmetric
+        cipher and authenticated with HMAC. Secret is power of g, so it
+        belongs to subgroup generated by g and doesn't leak through beta^q
+        :param reader: binary file-like object to read plaintext from
+        :param writer: binary file-like object to write ciphertext to (header is already written)
+        :param header: header of ciphertext
+        :return: 1 if success
+        """
+        p = self.keys['public']['p']
+        width = self.record_width()
+        secret = self.fixed_base_power('g', self.generate_session_key())
+        session = self.generate_session_key()
+        record = (self.fixed_base_power('g', session).to_bytes(width, 'big')
+                  + (self.fixed_base_power('y', session) * secret % p).to_bytes(width, 'big'))
+        encryption_key, mac_key = self._hybrid_keys(secret)
+        mac = hmac.new(mac_key, header + record, sha256)
+        writer.write(record)
+
+        offset = 0
+        for chunk in self._read_chunks(reader, STREAM_CHUNK_SIZE, HYBRID_SEGMENT_SIZE):
+            data = self._hybrid_xor(encryption_key, offset, chunk)
+            mac.update(data)
+            writer.write(data)
+            offset += len(chunk)
+        writer.write(mac.digest())
+        return 1
+
+    def _decrypt_hybrid(self, reader, writer, header):
+        """
+        Decrypts stream encrypted in hybrid mode. Plaintext is written before
+        authentication tag at the end of stream is checked, so if AssertionError
+        is raised, written plaintext must be discarded
+        :param reader: binary file-like object to read ciphertext from (header is already read)
+        :param writer: binary file-like object to write plaintext to
+        :param header: header of ciphertext
+        :return: 1 if successful
+        """
+        width = self.record_width()
+        record = self._read_exactly(reader, 2 * width)
+        assert len(record) == 2 * width, "File is damaged! Encrypted secret is incomplete."
+        secret, = self.decrypt_batch([(int.from_bytes(record[:width], 'big'),
+                                       int.from_bytes(record[width:], 'big'))])
+        encryption_key, mac_key = self._hybrid_keys(secret)
+        mac = hmac.new(mac_key, header + record, sha256)
+
+        # Authentication tag is the last HYBRID_TAG_SIZE bytes, so they are kept until the end of stream
+        pending = b''
+        offset = 0
+        for chunk in self._read_chunks(reader, STREAM_CHUNK_SIZE, HYBRID_SEGMENT_SIZE):
+            pending += chunk
+            size = (len(pending) - HYBRID_TAG_SIZE) // HYBRID_SEGMENT_SIZE * HYBRID_SEGMENT_SIZE
+            if size > 0:
+                data, pending = pending[:size], pending[size:]
+                mac.update(data)
+                writer.write(self._hybrid_xor(encryption_key, offset, data))
+                offset += size
+
+        assert len(pending) >= HYBRID_TAG_SIZE, "File is damaged! Authentication tag is missing."
+        data, tag = pending[:-HYBRID_TAG_SIZE], pending[-HYBRID_TAG_SIZE:]
+        mac.update(data)
+        writer.write(self._hybrid_xor(encryption_key, offset, data))
+        assert hmac.compare_digest(mac.digest(), tag), "Authentication failed! File is damaged or keys are incorrect."
+        return 1
+
+    def encrypt_stream(self, reader, writer, mode=None, fresh_session=True, workers=WORKERS):
+        """
+        Encrypts binary stream using ElGamal cipher. Stream is read and
+        written by chunks, so memory usage doesn't depend on stream size
+        :param reader: binary file-like object to read plaintext from
+        :param writer: binary file-like object to write ciphertext to
+        :param mode: MODE_BYTE to encrypt every byte separately, MODE_BLOCK to pack bytes into blocks,
+                     MODE_HYBRID to encrypt with symmetric cipher and ElGamal-encrypted secret,
+                     None is CIPHER_MODE (keys of subgroup profile can use only MODE_HYBRID, it's default for them)
+        :param fresh_session: if True, new random session key is used for every record,
+                              if False, session key of keys is used (only in byte mode)
+        :param workers: quantity of worker processes (0 or None is quantity of CPUs), hybrid mode always uses one
+        :return: 1 if success
+        """
+        mode = self.encryption_mode(mode)
+
+        if metrics.is_enabled():
+            reader = ProgressReader(reader, partial(metrics.count, 'encrypt.input_bytes'))
+        with metrics.span('encrypt', mode=mode, workers=workers):
+            header = self._pack_header(mode)
+            writer.write(header)
+            if mode == MODE_HYBRID:
+                return self._encrypt_hybrid(reader, writer, header)
+
+            tasks = ((chunk, mode, fresh_session, is_last)
+                     for chunk, is_last in self._read_plaintext_chunks(reader, mode))
+            for records in self._map_chunks('encrypt_chunk', tasks, workers):
+                writer.write(records)
+            return 1
+
+    def decrypt_stream(self, reader, writer, mode=MODE_BYTE, workers=WORKERS):
+        """
+        Decrypts binary stream using ElGamal cipher. Binary ciphertext is
+        detected automatically, legacy text ciphertext (alpha and beta as
+        decimal numbers on separate lines) is decrypted with selected mode
+        :param reader: binary file-like object to read ciphertext from
+        :param writer: binary file-like object to write plaintext to
+        :param mode: cipher mode that was used to encrypt legacy text ciphertext
+        :param workers: quantity of worker processes (0 or None is quantity of CPUs)
+        :return: 1 if successful
+        """
+        assert mode in MODE_CODES, f"Unknown cipher mode: {mode}"
+
+        if metrics.is_enabled():
+            reader = ProgressReader(reader, partial(metrics.count, 'decrypt.input_bytes'))
+        with metrics.span('decrypt', workers=workers):
+            head = self._read_exactly(reader, FILE_HEADER.size)
+            assert head, "Input file is empty! Nothing to decrypt."
+            if head.startswith(FILE_MAGIC):
+                mode = self._unpack_header(head)
+                if mode == MODE_HYBRID:
+                    return self._decrypt_hybrid(reader, writer, head)
+                chunks = self._read_chunks(reader, STREAM_CHUNK_SIZE, 2 * self.record_width())
+                tasks = ((chunk, mode) for chunk in chunks)
+                pieces = self._map_chunks('decrypt_chunk', tasks, workers)
+            else:
+                # Legacy text ciphertext is decrypted in this process by batches of records
+                assert mode in (MODE_BYTE, MODE_BLOCK), f"Legacy text file can't be decrypted in {mode} mode!"
+                records = self._pair_records(self._read_longints(reader, head))
+                batch_size = max(1, STREAM_CHUNK_SIZE // (2 * self.record_width()))
+                batches = iter(lambda: list(islice(records, batch_size)), [])
+                pieces = (self._decrypt_records(batch, mode) for batch in batches)
+
+            self._write_plaintext(pieces, writer, mode)
+            return 1
+
+    def encrypt_file(self, input_file_name='', output_file_name='', mode=None, fresh_session=True,
+                     workers=WORKERS):
         """
         Encrypts input_file_name file using ElGamal cipher
         :param input_file_name: path to input file
         :param output_file_name: path to output file
+        :param mode: MODE_BYTE to encrypt every byte separately, MODE_BLOCK to pack bytes into blocks,
+                     MODE_HYBRID to encrypt with symmetric cipher and ElGamal-encrypted secret,
+                     None is CIPHER_MODE (keys of subgroup profile can use only MODE_HYBRID, it's default for them)
+        :param fresh_session: if True, new random session key is used for every record,
+                              if False, session key of keys is used (only in byte mode)
+        :param workers: quantity of worker processes (0 or None is quantity of CPUs)
         :return: 1 if success
         """
         # Checking input and output file
         assert input_file_name and isfile(input_file_name), "Input file wasn't selected!"
         assert output_file_name, "Output file wasn't selected!"
+        mode = self.encryption_mode(mode)
 
         # Encrypting file and saving result
-        alpha = pow(self.keys['public']['g'], self.keys['session'], self.keys['public']['p'])
         try:
-            debug_message('Encrypting...')
-            with open(output_file_name, 'w') as f:
-                for _byte in self._open_file_binary(input_file_name):
-                    beta = self.encrypt_byte(_byte)
-                    f.write(str(alpha) + '\n')
-                    f.write(str(beta) + '\n')
-        except Exception:
-            debug_message(f"Error occurred while encrypting file ({Exception})")
-            raise AssertionError(f"File encrypting error! ({Exception})")
+            with open(input_file_name, 'rb') as reader, open(output_file_name, 'wb') as writer:
+                return self.encrypt_stream(reader, writer, mode, fresh_session, workers)
+        except Exception as e:
+            debug_message(f"Error occurred while encrypting file ({e})")
+            raise AssertionError(f"File encrypting error! ({e})")
 
-        return 1
-
-    def decrypt_file(self, input_file_name='', output_file_name=''):
+    def decrypt_file(self, input_file_name='', output_file_name='', mode=MODE_BYTE, workers=WORKERS):
         """
-        Decrypts file using ElGamal cipher
+        Decrypts file using ElGamal cipher. Binary ciphertext files are
+        detected automatically, legacy text files are decrypted with selected mode
         :param input_file_name: path to input file
         :param output_file_name: path to output file
+        :param mode: cipher mode that was used to encrypt legacy text file
+        :param workers: quantity of worker processes (0 or None is quantity of CPUs)
         :return: 1 if successful
         """
 
@@ -126,61 +794,219 @@ class ElGamal:
         assert input_file_name and isfile(input_file_name), "Input file wasn't selected!"
         assert output_file_name, "Output file wasn't selected!"
 
-        with open(output_file_name, 'wb') as output_file:
-            # To iterate file as int values, I'm using generator
-            input_file = self._open_file_longint(input_file_name)
-            try:
-                alpha = input_file.__next__()
-                beta = input_file.__next__()
-            except StopIteration:
-                raise AssertionError("Input file is empty! Nothing to decrypt.")
-
-            x = self.keys['private']
-            p = self.keys['public']['p']
-
-            while alpha and beta:
-                message_byte = bytes(chr((beta % p * (pow(alpha, (p - 1 - x), p))) % p), "ascii")
-                output_file.write(message_byte)
-                try:
-                    alpha = input_file.__next__()
-                    beta = input_file.__next__()
-                except StopIteration:
-                    alpha = 0
-                    beta = 0
-        return 1
+        try:
+            with open(input_file_name, 'rb') as reader, open(output_file_name, 'wb') as writer:
+                return self.decrypt_stream(reader, writer, mode, workers)
+        except AssertionError:
+            # Partially decrypted or not authenticated plaintext mustn't be kept
+            remove(output_file_name)
+            raise
 
     @staticmethod
     def check_p_key(p_key):
+        # Standard groups are trusted without checking
+        if groups.find_group(p_key):
+            return True
         if p_key and p_key > 256:
             return True
         return False
 
     @staticmethod
-    def check_g_key(g_key, p_key):
+    def check_q_key(q_key, p_key):
+        # Order of subgroup is prime divisor of p - 1
+        if q_key and p_key and 1 < q_key < p_key and (p_key - 1) % q_key == 0 and primes.is_prime(q_key):
+            return True
+        return False
+
+    @staticmethod
+    def check_g_key(g_key, p_key, q_key=None):
+        # g generates subgroup of prime order q if g^q (mod p) is equal to 1
+        if q_key:
+            if g_key and p_key and 1 < g_key < p_key and arithmetic.power(g_key, q_key, p_key) == 1:
+                return True
+            return False
+        # Generator of standard group generates subgroup of order (p - 1) / 2,
+        # it isn't primitive root, but it's trusted without checking
+        if groups.find_group(p_key, g_key):
+            return True
         if g_key and p_key:
             p1 = 2
             p2 = (p_key - 1) // p1
             # g is a primitive root if for all prime factors of p-1, p[i]
             # g^((p-1)/p[i]) (mod p) is not equal to 1
-            if not (pow(g_key, (p_key - 1) // p1, p_key) == 1):
-                if not pow(g_key, (p_key - 1) // p2, p_key) == 1:
+            if not (arithmetic.power(g_key, (p_key - 1) // p1, p_key) == 1):
+                if not arithmetic.power(g_key, (p_key - 1) // p2, p_key) == 1:
                     return True
         return False
 
     @staticmethod
     def check_y_key(y_key, p_key, g_key, x_key):
-        if y_key == pow(g_key, x_key, p_key):
+        # y = g^x belongs to subgroup generated by g
+        if y_key == arithmetic.power(g_key, x_key, p_key):
             return True
         return False
 
     @staticmethod
-    def check_x_key(x_key, p_key):
-        if 2 < x_key < p_key - 1:
+    def check_x_key(x_key, p_key, q_key=None):
+        if 2 < x_key < (q_key or p_key - 1):
             return True
         return False
 
     @staticmethod
-    def check_k_key(k_key, p_key):
+    def check_k_key(k_key, p_key, q_key=None):
+        if q_key:
+            return 1 < k_key < q_key
         if (1 < k_key < p_key) and (primes.gcd(k_key, p_key) == 1):
             return True
         return False
+
+
+# Cipher of worker process used by parallel encryption and decryption
+_worker_cipher = None
+
+
+def _init_worker(keys, backend):
+    """
+    Initializing cipher of worker process
+    :param keys: dict that includes public, private and session key
+    :param backend: name of arithmetic backend
+    :return: None
+    """
+    global _worker_cipher
+    arithmetic.set_backend(backend)
+    _worker_cipher = ElGamal()
+    _worker_cipher.set_keys(keys)
+
+
+def _run_worker(method_name, *args):
+    """
+    Running method of worker process cipher
+    :param method_name: name of ElGamal method
+    :param args: method arguments
+    :return: method result
+    """
+    return getattr(_worker_cipher, method_name)(*args)
+
+
+if __name__ == '__main__':
+    # Round trip and damaged file tests
+    import os
+    import shutil
+    import tempfile
+
+    work_dir = tempfile.mkdtemp(prefix='elgamal_test_')
+    plain_file, cipher_file, decrypted_file = (os.path.join(work_dir, name)
+                                               for name in ('plain', 'cipher', 'decrypted'))
+
+    def write(file_name, data):
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+    def read(file_name):
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    def round_trip(cipher, data, **kwargs):
+        write(plain_file, data)
+        cipher.encrypt_file(plain_file, cipher_file, **kwargs)
+        cipher.decrypt_file(cipher_file, decrypted_file, workers=kwargs.get('workers', WORKERS))
+        assert read(decrypted_file) == data, f"Decrypted file differs ({len(data)} bytes, {kwargs})!"
+
+    def decrypt_damaged(cipher, data, message, **kwargs):
+        write(cipher_file, data)
+        try:
+            cipher.decrypt_file(cipher_file, decrypted_file, **kwargs)
+        except AssertionError as e:
+            assert message in str(e), f"Unexpected error: {e}"
+            assert not isfile(decrypted_file), "Output of damaged file isn't removed!"
+        else:
+            raise AssertionError(f"Damaged file is decrypted ({message})!")
+
+    try:
+        cipher = ElGamal()
+        cipher.generate_keys(512)
+        block_size = cipher.block_size()
+        width = cipher.record_width()
+
+        # Byte and block mode, including empty file, padding edges and several chunks (except slow byte mode)
+        for size in (0, 1, block_size - 1, block_size, block_size + 1, 3 * block_size, STREAM_CHUNK_SIZE + 1):
+            data = os.urandom(size)
+            for mode in (MODE_BYTE, MODE_BLOCK):
+                if mode != MODE_BYTE or size < STREAM_CHUNK_SIZE:
+                    round_trip(cipher, data, mode=mode)
+        round_trip(cipher, os.urandom(1000), mode=MODE_BYTE, fresh_session=False)
+
+        # Legacy text file (the same alpha for every byte) is detected and decrypted
+        data = os.urandom(100)
+        alpha = pow(cipher.keys['public']['g'], cipher.keys['session'], cipher.keys['public']['p'])
+        write(cipher_file, ''.join(f'{alpha}\n{cipher.encrypt_byte(byte)}\n' for byte in data).encode())
+        cipher.decrypt_file(cipher_file, decrypted_file)
+        assert read(decrypted_file) == data, "Legacy text file is decrypted wrong!"
+
+        # Damaged files
+        write(plain_file, os.urandom(1000))
+        for mode in (MODE_BYTE, MODE_BLOCK):
+            cipher.encrypt_file(plain_file, cipher_file, mode=mode)
+            ciphertext = read(cipher_file)
+            decrypt_damaged(cipher, ciphertext[:-1], "Last record is incomplete.")
+            decrypt_damaged(cipher, ciphertext[:FILE_HEADER.size - 1] + bytes([MODE_CODES[mode] + 10]) +
+                            ciphertext[FILE_HEADER.size:], "Unknown cipher mode code")
+        decrypt_damaged(cipher, b'', "Input file is empty!")
+        decrypt_damaged(cipher, cipher._pack_header(MODE_BLOCK), "Padding block is missing.")
+        decrypt_damaged(cipher, b'12\n34\n56\n', "Last record is incomplete.")
+        decrypt_damaged(cipher, os.urandom(1000).replace(FILE_MAGIC, b''), "Text file includes not only numbers.")
+        other_cipher = ElGamal()
+        other_cipher.generate_keys(256)
+        cipher.encrypt_file(plain_file, cipher_file, mode=MODE_BLOCK)
+        decrypt_damaged(other_cipher, read(cipher_file), "File was encrypted with another key!")
+
+        # Block mode uses new session key for every record, even if shared session key is requested
+        write(plain_file, bytes(3 * block_size))
+        cipher.encrypt_file(plain_file, cipher_file, mode=MODE_BLOCK, fresh_session=False)
+        records = read(cipher_file)[FILE_HEADER.size:]
+        alphas = {records[i:i + width] for i in range(0, len(records), 2 * width)}
+        assert len(alphas) == len(records) // (2 * width), "Block mode reuses session key!"
+
+        # Chunks are encrypted and decrypted by worker processes in order
+        round_trip(cipher, os.urandom(STREAM_CHUNK_SIZE * 2), mode=MODE_BLOCK, workers=2)
+
+        # Hybrid mode: several segments, tampered or missing tag and wrong keys
+        for size in (0, 1, HYBRID_SEGMENT_SIZE, STREAM_CHUNK_SIZE + 1):
+            round_trip(cipher, os.urandom(size), mode=MODE_HYBRID)
+        write(plain_file, os.urandom(1000))
+        cipher.encrypt_file(plain_file, cipher_file, mode=MODE_HYBRID)
+        ciphertext = read(cipher_file)
+        decrypt_damaged(cipher, ciphertext[:-1] + bytes([ciphertext[-1] ^ 1]), "Authentication failed!")
+        decrypt_damaged(cipher, ciphertext[:FILE_HEADER.size + 2 * width + 10], "Authentication tag is missing.")
+        other_cipher.generate_keys(512)
+        decrypt_damaged(other_cipher, ciphertext, "Authentication failed!")
+
+        # Keys of subgroup profile encrypt only in hybrid mode
+        subgroup_cipher = ElGamal()
+        subgroup_cipher.generate_keys(group='ffdhe2048', profile=KEY_PROFILE_SUBGROUP)
+        round_trip(subgroup_cipher, os.urandom(1000))
+        for mode in (MODE_BYTE, MODE_BLOCK):
+            try:
+                subgroup_cipher.encrypt_file(plain_file, cipher_file, mode=mode)
+            except AssertionError:
+                pass
+            else:
+                raise AssertionError(f"Keys of subgroup profile encrypt in {mode} mode!")
+
+        # Saved keys are loaded back, private key is readable only by owner
+        key_path = os.path.join(work_dir, 'keys')
+        cipher.generate_keys(group='ffdhe2048', profile=KEY_PROFILE_SUBGROUP)
+        assert cipher.save_keys(key_path), "Keys aren't saved!"
+        assert os.stat(os.path.join(key_path, 'id_elgamal')).st_mode & 0o777 == 0o600, "Private key is readable!"
+        loaded_cipher = ElGamal()
+        assert loaded_cipher.load_keys(key_path), "Keys aren't loaded!"
+        assert loaded_cipher.keys['public'] == cipher.keys['public'] and \
+            loaded_cipher.keys['private'] == cipher.keys['private'], "Loaded keys differ!"
+        public_cipher = ElGamal()
+        assert public_cipher.load_keys(key_path, private=False), "Public key isn't loaded!"
+        public_cipher.encrypt_file(plain_file, cipher_file)
+        cipher.decrypt_file(cipher_file, decrypted_file)
+        assert read(decrypted_file) == read(plain_file), "File encrypted with loaded public key is decrypted wrong!"
+        print('All tests passed')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
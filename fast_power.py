@@ -1,137 +1,318 @@
 """
-Unit for implementing fast power algorithms and testing them.
-Two fast power algorithms were implemented and tested using different inputs
+Unit for implementing modular power algorithms.
 
-Result: built in power function is faster than this algorithms,
-        but recursively it works faster.
+Every power function takes base, exponent and modulus and returns
+base^exponent mod modulus:
+    * builtin_power - built-in pow() (default backend)
+    * fast_power, fast_power_recur - binary (square-and-multiply) method
+    * sliding_window_power - sliding window method with table of odd powers
+    * montgomery_ladder_power - Montgomery ladder, the same operations for every bit
+    * multi_power - product of several powers in one pass (Straus' method)
+    * FixedBasePower - precomputed table for fixed base and modulus
 
-Top 3 fast power algorithms:
-    1. Built-in power()
-    2. fast_power_recursive()
-    3. fast_power
+Python arithmetic backend (see arithmetic.py) calls mod_power(), which uses
+algorithm selected by POWER_BACKEND setting or set_power_backend(). Algorithms are compared with
+built-in pow() by benchmark suite (python -m ElGamalCipher.benchmark --suite power).
 """
-from time import time
+from ElGamalCipher.settings import POWER_BACKEND, POWER_WINDOW
 
+# Max depth of recursion of fast_power_recur()
+RECURSION_MAX_DEPTH = 64
 
-def fast_power(base, power):
+
+def builtin_power(base, exponent, modulus):
+    return pow(base, exponent, modulus)
+
+
+def fast_power(base, exponent, modulus=None):
+    """
+    Right-to-left binary power
+    :param base: base
+    :param exponent: non-negative exponent
+    :param modulus: modulus, if it's not set, power isn't reduced
+    :return: base^exponent (mod modulus)
+    """
+    assert exponent >= 0, "Exponent must be non-negative!"
     result = 1
-    while power > 0:
-        if power % 2:
-            power -= 1
+    if modulus is not None:
+        base %= modulus
+        result %= modulus
+    while exponent > 0:
+        if exponent & 1:
             result *= base
-        else:
-            power >>= 1
+            if modulus is not None:
+                result %= modulus
+        exponent >>= 1
+        if exponent:
             base *= base
+            if modulus is not None:
+                base %= modulus
     return result
 
 
-def fast_power_recur(base, power):
-    if power == 0:
-        return 1
-    if power == -1:
-        return 1. / base
-    if power % 2 == 1:
-        return fast_power_recur(base, power - 1) * base
-    else:
-        result = fast_power_recur(base, power / 2)
-        return result * result
+def fast_power_recur(base, exponent, modulus=None, digit_bits=None):
+    """
+    Recursive power: base^e = (base^(e >> k))^(2^k) * base^(e mod 2^k). Exponent
+    is split into k-bit digits, k is chosen so that depth of recursion is at
+    most RECURSION_MAX_DEPTH for exponent of any size (k = 1 is binary method)
+    :param base: base
+    :param exponent: non-negative exponent
+    :param modulus: modulus, if it's not set, power isn't reduced
+    :param digit_bits: size of digit k (in bits), by default it depends on size of exponent
+    :return: base^exponent (mod modulus)
+    """
+    assert exponent >= 0, "Exponent must be non-negative!"
+    if digit_bits is None:
+        digit_bits = max(1, -(-exponent.bit_length() // RECURSION_MAX_DEPTH))
+    if exponent == 0:
+        return 1 % modulus if modulus is not None else 1
+    result = fast_power_recur(base, exponent >> digit_bits, modulus, digit_bits)
+    for _ in range(digit_bits):
+        result *= result
+        if modulus is not None:
+            result %= modulus
+    digit = exponent & ((1 << digit_bits) - 1)
+    if digit:
+        result *= fast_power(base, digit, modulus)
+    return result % modulus if modulus is not None else result
 
 
-if __name__ == '__main__':
+def sliding_window_power(base, exponent, modulus, window=POWER_WINDOW):
     """
-    Testing this 3 algorithms
+    Left-to-right sliding window power. Only odd powers base^1, base^3, ...,
+    base^(2^window - 1) are precomputed, runs of zero bits cost only squarings
+    :param base: base
+    :param exponent: non-negative exponent
+    :param modulus: modulus
+    :param window: max size of window (in bits)
+    :return: base^exponent mod modulus
     """
+    assert exponent >= 0, "Exponent must be non-negative!"
+    base %= modulus
+    if exponent < 1 << window:
+        window = max(exponent.bit_length() // 2, 1)
 
+    # odd_powers[i] is base^(2i + 1)
+    square = base * base % modulus
+    odd_powers = [base]
+    for _ in range((1 << (window - 1)) - 1):
+        odd_powers.append(odd_powers[-1] * square % modulus)
 
-    def lines(func):
-        """
-        Decorator for output result separated by lines
-        :param func: function to implement
-        :return:
-        """
+    result = 1 % modulus
+    i = exponent.bit_length() - 1
+    while i >= 0:
+        if not (exponent >> i) & 1:
+            result = result * result % modulus
+            i -= 1
+            continue
+        # The longest window ending with set bit
+        j = max(i - window + 1, 0)
+        while not (exponent >> j) & 1:
+            j += 1
+        for _ in range(i - j + 1):
+            result = result * result % modulus
+        digit = (exponent >> j) & ((1 << (i - j + 1)) - 1)
+        result = result * odd_powers[digit >> 1] % modulus
+        i = j - 1
+    return result
 
-        def wrapper(*args, **kwargs):
-            print('-------------------------')
-            func(*args, **kwargs)
-            print('-------------------------\n')
 
-        return wrapper
+def montgomery_ladder_power(base, exponent, modulus):
+    """
+    Montgomery ladder power. Every bit of exponent costs one multiplication
+    and one squaring, whatever value it has, so sequence of operations
+    doesn't depend on exponent
+    :param base: base
+    :param exponent: non-negative exponent
+    :param modulus: modulus
+    :return: base^exponent mod modulus
+    """
+    assert exponent >= 0, "Exponent must be non-negative!"
+    low, high = 1 % modulus, base % modulus
+    for i in reversed(range(exponent.bit_length())):
+        if (exponent >> i) & 1:
+            low, high = low * high % modulus, high * high % modulus
+        else:
+            low, high = low * low % modulus, low * high % modulus
+    return low
 
 
-    def catch_time(func):
-        """
-        Counting time function
-        :param func: function to implement
-        :return: dictionary, that includes time of implementation and function result
-        """
+def multi_power(bases, exponents, modulus, window=2):
+    """
+    Straus' method (Shamir's trick): product of powers base_i^exponent_i mod
+    modulus in one pass. Squarings are shared by all powers, table keeps
+    products of all combinations of window digits
+    :param bases: sequence of bases
+    :param exponents: sequence of non-negative exponents (the same length as bases)
+    :param modulus: modulus
+    :param window: size of window (in bits)
+    :return: product of powers mod modulus
+    """
+    assert len(bases) == len(exponents), "Quantity of bases and exponents must be the same!"
+    assert all(exponent >= 0 for exponent in exponents), "Exponents must be non-negative!"
+    if not bases:
+        return 1 % modulus
+    # Size of table is 2^(window * quantity of bases)
+    window = max(min(window, 8 // len(bases)), 1)
+    mask = (1 << window) - 1
+
+    # table[index] is product of base_i^digit_i, where digit_i are window-bit parts of index
+    table = [1 % modulus]
+    for base in bases:
+        powers = [1 % modulus]
+        for _ in range(mask):
+            powers.append(powers[-1] * base % modulus)
+        table = [value * power % modulus for power in powers for value in table]
+
+    windows = (max(exponent.bit_length() for exponent in exponents) + window - 1) // window
+    result = 1 % modulus
+    for i in reversed(range(windows)):
+        for _ in range(window):
+            result = result * result % modulus
+        index = 0
+        for k, exponent in enumerate(exponents):
+            index |= ((exponent >> (i * window)) & mask) << (k * window)
+        if index:
+            result = result * table[index] % modulus
+    return result
 
-        def wrapper(*args, **kwargs):
-            _time = time()
-            funciton_result = func(*args, **kwargs)
-            _time = time() - _time
-            return {'time': _time, 'result': funciton_result}
 
-        return wrapper
+# Backends of mod_power()
+POWER_BACKENDS = {
+    'builtin': builtin_power,
+    'binary': fast_power,
+    'sliding_window': sliding_window_power,
+    'ladder': montgomery_ladder_power,
+}
+_power_backend = builtin_power
 
 
-    @lines
-    def test_power(base, power):
-        def _print_time(time, result):
-            print(f'Done! Total time: {time}, result: {result}')
+def set_power_backend(name):
+    """
+    Selecting algorithm used by mod_power()
+    :param name: name of backend (see POWER_BACKENDS)
+    :return: None
+    """
+    global _power_backend
+    assert name in POWER_BACKENDS, f"Unknown power backend: {name}"
+    _power_backend = POWER_BACKENDS[name]
 
-        @catch_time
-        def _python_power(base, power):
-            print('Python power...')
-            return base ** power
 
-        @catch_time
-        def _fast_power(base, power):
-            print('Fast power...')
-            return fast_power(base, power)
+def mod_power(base, exponent, modulus):
+    """
+    Calculating base^exponent mod modulus with selected backend
+    :param base: base
+    :param exponent: non-negative exponent
+    :param modulus: modulus
+    :return: result of modular power
+    """
+    return _power_backend(base, exponent, modulus)
 
-        @catch_time
-        def _fast_power_recur(base, power):
-            print('Fast power recursive...')
-            return fast_power_recur(base, power)
 
-        print(f'Calculating {base}^{power}...')
-        result_python_power = _python_power(base, power)
-        _print_time(result_python_power['time'], result_python_power['result'])
+set_power_backend(POWER_BACKEND)
 
-        result_fast_power = _fast_power(base, power)
-        _print_time(result_fast_power['time'], result_fast_power['result'])
 
-        result_fast_power_recur = _fast_power_recur(base, power)
-        _print_time(result_fast_power_recur['time'], result_fast_power_recur['result'])
+class FixedBasePower:
+    """
+    Modular power with fixed base and modulus using precomputed table
+    (fixed-base windowed method). Exponent is split into windows of
+    `window` bits, and for each window position i table keeps values
+    base^(j * 2^(window * i)) mod p, so power needs only one multiplication
+    per window and no squarings at all.
+    """
 
-        time_list = [result_python_power['time'], result_fast_power['time'], result_fast_power_recur['time']]
-        min_time = min(time_list)
-        if min_time == time_list[0]:
-            print('Python\'s power is the fastest')
-        elif min_time == time_list[1]:
-            print('Fast power is the fastest')
-        else:
-            print('Fast power (recursive) is the fastest')
-
-
-    print('Fast power testing:')
-    print('Test 1')
-    test_power(10, 2)
-    print('Test 2')
-    test_power(10, 20)
-    print('Test 3')
-    test_power(10, 200)
-    print('Test 4')
-    test_power(10, 2000)
-    print('Test 5')
-    test_power(10, 20000)
-    print('Test 6')
-    test_power(10, 20000)
-    print('Test 7')
-    test_power(10000, 20000)
-    print('Test 8')
-    test_power(1000000000, 2000)
-    print('Test 9')
-    test_power(1000000000000, 2000)
-    print('Test 10')
-    test_power(1000000000000, 10000)
+    def __init__(self, base, modulus, max_bits, window=6):
+        """
+        Building table of powers
+        :param base: fixed base
+        :param modulus: fixed modulus
+        :param max_bits: max size of exponent (in bits)
+        :param window: size of window (in bits), table has 2^window values per window
+        """
+        self.base = base
+        self.modulus = modulus
+        self.max_bits = max_bits
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.table = []
+
+        window_base = base % modulus
+        for _ in range((max_bits + window - 1) // window):
+            row = [1]
+            for _ in range(self.mask):
+                row.append(row[-1] * window_base % modulus)
+            self.table.append(row)
+            # base^(2^(window * (i + 1))) is the first value of the next row
+            window_base = row[-1] * window_base % modulus
+
+    @staticmethod
+    def memory_size(max_bits, window):
+        """
+        Estimating memory used by table of powers (modulus has max_bits bits too)
+        :param max_bits: max size of exponent (in bits)
+        :param window: size of window (in bits)
+        :return: approximate size of table (in bytes)
+        """
+        # Every value is int object: about 28 bytes of header and max_bits / 8 bytes of digits
+        return (max_bits + window - 1) // window * (1 << window) * (28 + max_bits // 8)
+
+    def power(self, exponent):
+        """
+        Calculating base^exponent mod modulus
+        :param exponent: non-negative exponent
+        :return: result of modular power
+        """
+        if exponent < 0:
+            return pow(self.base, exponent, self.modulus)
+        if exponent.bit_length() > self.max_bits:
+            return mod_power(self.base, exponent, self.modulus)
+
+        result = 1
+        modulus = self.modulus
+        mask = self.mask
+        window = self.window
+        for row in self.table:
+            if not exponent:
+                break
+            digit = exponent & mask
+            if digit:
+                result = result * row[digit] % modulus
+            exponent >>= window
+        return result
+
+
+if __name__ == '__main__':
+    # Testing all algorithms against built-in pow()
+    import random
+
+    rand = random.Random(0)
+    for bits in (8, 64, 521, 1024):
+        modulus = rand.getrandbits(bits) | (1 << (bits - 1)) | 1
+        exponents = [0, 1, 2, modulus - 1] + [rand.getrandbits(bits) for _ in range(10)]
+        bases = [0, 1, modulus - 1] + [rand.randrange(modulus) for _ in range(5)]
+        for base in bases:
+            for exponent in exponents:
+                expected = pow(base, exponent, modulus)
+                for name, backend in POWER_BACKENDS.items():
+                    assert backend(base, exponent, modulus) == expected, f"{name} power is wrong!"
+                for window in (1, 3, POWER_WINDOW):
+                    assert sliding_window_power(base, exponent, modulus, window) == expected, \
+                        "Sliding window power is wrong!"
+                assert fast_power_recur(base, exponent, modulus) == expected, "Recursive power is wrong!"
+        for quantity in (1, 2, 3):
+            powers = [(rand.randrange(modulus), rand.getrandbits(bits)) for _ in range(quantity)]
+            expected = 1
+            for base, exponent in powers:
+                expected = expected * pow(base, exponent, modulus) % modulus
+            assert multi_power(*zip(*powers), modulus) == expected, "Multi power is wrong!"
+
+        # Fixed-base table, exponents longer than table fall back to mod_power()
+        table = FixedBasePower(bases[-1], modulus, bits)
+        for exponent in exponents + [1 << (bits + 10)]:
+            assert table.power(exponent) == pow(bases[-1], exponent, modulus), "Fixed-base power is wrong!"
+    # Depth of recursion doesn't depend on size of exponent
+    modulus = rand.getrandbits(8192) | 1
+    exponent = rand.getrandbits(8192)
+    assert fast_power_recur(3, exponent, modulus) == pow(3, exponent, modulus), "Recursive power is wrong!"
+    assert fast_power(3, 100) == 3 ** 100 and fast_power_recur(3, 100) == 3 ** 100, "Power without modulus is wrong!"
+    print('All tests passed')
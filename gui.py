@@ -1,15 +1,24 @@
+import threading
 import tkinter as tk
-from random import randrange
+from copy import deepcopy
+from os import remove
+from os.path import getsize, isfile
 from time import time
 from tkinter import filedialog
+from tkinter import font
 from tkinter import ttk
 
+import ElGamalCipher.arithmetic as arithmetic
 import ElGamalCipher.encryption as encrypt
+import ElGamalCipher.groups as groups
 import ElGamalCipher.primes as primes
+from ElGamalCipher.pool import ParameterPool
+from ElGamalCipher.viewer import open_view
 from ElGamalCipher.settings import *
-from ElGamalCipher.core import debug_message
+from ElGamalCipher.core import debug_message, JobCancelled, ProgressReader
 
 encryption = encrypt.ElGamal()
+parameter_pool = ParameterPool()
 
 
 def popup_message(message, status=1, **kwargs):
@@ -105,6 +114,184 @@ def popup_message(message, status=1, **kwargs):
     button_frame.grid(column=0, row=1, sticky='n e s w', padx=2, pady=5)
 
 
+class FileJob:
+    """
+    Encryption or decryption of file running in worker thread. Thread only
+    updates plain attributes of job, so Tk widgets are updated by polling
+    them from main loop
+    """
+
+    def __init__(self, method, input_file_name, output_file_name):
+        """
+        :param method: encrypt_stream or decrypt_stream method of job's own cipher
+        :param input_file_name: path to input file
+        :param output_file_name: path to output file, removed if job fails or is cancelled
+        """
+        self.method = method
+        self.input_file_name = input_file_name
+        self.output_file_name = output_file_name
+        self.total = getsize(input_file_name)
+        self.processed = 0
+        self.is_cancelled = False
+        self.is_done = False
+        self.error = None
+        self.start_time = time()
+        self.end_time = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.start_time = time()
+        self.thread.start()
+
+    def run(self):
+        """
+        Body of worker thread
+        :return: None
+        """
+        try:
+            with open(self.input_file_name, 'rb') as reader, open(self.output_file_name, 'wb') as writer:
+                self.method(ProgressReader(reader, self.report, lambda: self.is_cancelled), writer)
+        except JobCancelled:
+            self.remove_output()
+        except Exception as e:
+            self.error = e
+            self.remove_output()
+        finally:
+            self.end_time = time()
+            self.is_done = True
+
+    def report(self, size):
+        self.processed += size
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def remove_output(self):
+        if isfile(self.output_file_name):
+            remove(self.output_file_name)
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time()) - self.start_time
+
+    @property
+    def speed(self):
+        """
+        :return: speed of job in MB/s
+        """
+        elapsed = self.elapsed
+        return self.processed / 2 ** 20 / elapsed if elapsed else 0.0
+
+
+class ParamsJob:
+    """
+    Generation of domain parameters running in worker thread. Like FileJob,
+    thread only updates plain attributes of job, which are polled from main loop
+    """
+
+    def __init__(self, generate):
+        """
+        :param generate: function without arguments that returns (p, q, g), q is None for full key profile
+        """
+        self.generate = generate
+        self.params = None
+        self.is_done = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        """
+        Body of worker thread
+        :return: None
+        """
+        try:
+            self.params = self.generate()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.is_done = True
+
+
+class VirtualText(ttk.Frame):
+    """
+    Read-only text field that shows rows of file view. Only rows in view are
+    inserted into text widget, scrollbar position is calculated from index
+    of the first shown row
+    """
+
+    def __init__(self, parent):
+        ttk.Frame.__init__(self, parent)
+        self.view = None
+        self.first_row = 0
+        self.line_height = font.Font(font=ENTRY_FONT).metrics('linespace')
+
+        self.scroll = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scroll.pack(side='right', fill='y')
+        self.text = tk.Text(self,
+                            font=ENTRY_FONT,
+                            background=BUTTON_COLOR_LIGHT,
+                            foreground=BACKGROUND_COLOR_GRAY,
+                            relief='flat',
+                            wrap='none',
+                            state='disabled')
+        self.text.pack(fill='both', expand=True)
+        self.text.bind('<Configure>', lambda event: self.render())
+        self.text.bind('<MouseWheel>', lambda event: self.yview('scroll', -event.delta // 120, 'units'))
+        self.text.bind('<Button-4>', lambda event: self.yview('scroll', -1, 'units'))
+        self.text.bind('<Button-5>', lambda event: self.yview('scroll', 1, 'units'))
+        self.text.bind('<Prior>', lambda event: self.yview('scroll', -1, 'pages'))
+        self.text.bind('<Next>', lambda event: self.yview('scroll', 1, 'pages'))
+
+    def set_view(self, view):
+        """
+        Showing rows of another file view
+        :param view: FileView or None to clear text
+        :return: None
+        """
+        self.view = view
+        self.first_row = 0
+        self.render()
+
+    def visible_rows(self):
+        return max(self.text.winfo_height() // self.line_height, 1)
+
+    def yview(self, *args):
+        """
+        Handling scrollbar and mouse commands ('moveto', fraction) or ('scroll', number, 'units' or 'pages')
+        :return: 'break' to stop default scrolling of text widget
+        """
+        if self.view:
+            if args[0] == 'moveto':
+                self.first_row = int(float(args[1]) * len(self.view))
+            elif args[0] == 'scroll':
+                step = self.visible_rows() if args[2] == 'pages' else 1
+                self.first_row += int(args[1]) * step
+            self.render()
+        return 'break'
+
+    def render(self):
+        """
+        Inserting rows in view into text widget
+        :return: None
+        """
+        rows = len(self.view) if self.view else 0
+        visible = self.visible_rows()
+        self.first_row = max(min(self.first_row, rows - visible), 0)
+
+        self.text.configure(state='normal')
+        self.text.delete('1.0', 'end')
+        if self.view:
+            self.text.insert('1.0', '\n'.join(self.view.rows(self.first_row, visible)))
+        self.text.configure(state='disabled')
+        if rows > visible:
+            self.scroll.set(self.first_row / rows, (self.first_row + visible) / rows)
+        else:
+            self.scroll.set(0, 1)
+
+
 class CryptApp(tk.Tk):
     """
         Main class for initializing multiple windows and handle it.
@@ -202,6 +389,9 @@ class MainPage(ttk.Frame):
                         )
         style.configure('navigate.TFrame',
                         background=BACKGROUND_COLOR_GRAY_DARKER)
+        style.configure('progress.Horizontal.TProgressbar',
+                        troughcolor=BACKGROUND_COLOR_GRAY_DARKER,
+                        background=SUCCESS_COLOR)
 
         left_frame = ttk.Frame(self, style='navigate.TFrame')
         left_frame.rowconfigure(0, weight=1)
@@ -223,14 +413,14 @@ class MainPage(ttk.Frame):
         button_set_keys = ttk.Button(left_frame, style='dark.TButton', text='Set keys',
                                      command=lambda: controller.show_frame(SelectKeys))
         button_set_keys.grid(column=0, row=2, sticky='e w', pady=1)
-        button_encrypt = ttk.Button(left_frame, style='dark.TButton', text='Encrypt',
+        self.button_encrypt = ttk.Button(left_frame, style='dark.TButton', text='Encrypt',
                                     command=lambda: self.encrypt_file(controller, is_encrypt=True))
-        button_encrypt.grid(column=0, row=3, sticky='e w', pady=1)
-        button_decrypt = ttk.Button(left_frame, style='dark.TButton', text='Decrypt',
+        self.button_encrypt.grid(column=0, row=3, sticky='e w', pady=1)
+        self.button_decrypt = ttk.Button(left_frame, style='dark.TButton', text='Decrypt',
                                     command=lambda: self.encrypt_file(controller, is_encrypt=False))
-        button_decrypt.grid(column=0, row=4, sticky='e w', pady=1)
+        self.button_decrypt.grid(column=0, row=4, sticky='e w', pady=1)
         button_show_file = ttk.Button(left_frame, style='dark.TButton', text='Show file bytes',
-                                      command=lambda: controller.show_frame(ShowFile))
+                                      command=lambda: controller.frames[ShowFile].open_files(controller))
         button_show_file.grid(column=0, row=5, sticky='e w', pady=1)
 
         # Right part info
@@ -243,6 +433,7 @@ class MainPage(ttk.Frame):
         right_frame.rowconfigure(4, weight=1)
         right_frame.rowconfigure(5, weight=0)
         right_frame.rowconfigure(6, weight=5)
+        right_frame.rowconfigure(7, weight=1)
 
         # Initializing right side info
         label_file_status = ttk.Label(right_frame, style='info.TLabel', text='File status:')
@@ -258,6 +449,21 @@ class MainPage(ttk.Frame):
         self.label_encrypt_status = ttk.Label(right_frame, style='status.TLabel')
         self.label_encrypt_status.grid(column=0, columnspan=2, row=6, sticky='n e s w')
 
+        # Progress of running job, hidden while there is no job
+        self.job = None
+        self.progress_frame = ttk.Frame(right_frame)
+        self.progress_frame.columnconfigure(0, weight=1)
+        self.progress_frame.columnconfigure(1, weight=0)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, style='progress.Horizontal.TProgressbar',
+                                            orient='horizontal', mode='determinate')
+        self.progress_bar.grid(column=0, row=0, sticky='e w', padx=10)
+        button_cancel = ttk.Button(self.progress_frame, style='dark.TButton', text='Cancel', command=self.cancel_job)
+        button_cancel.grid(column=1, row=0, rowspan=2, padx=10)
+        self.label_progress = ttk.Label(self.progress_frame, style='info_value.TLabel')
+        self.label_progress.grid(column=0, row=1, sticky='e w', padx=10)
+        self.progress_frame.grid(column=0, columnspan=2, row=7, sticky='e w', padx=30, pady=10)
+        self.progress_frame.grid_remove()
+
         self.label_file_status_value = ttk.Label(right_frame, style='info_value.TLabel', text='')
         self.label_file_status_value.grid(column=1, row=1, sticky='n e s w')
         label_public_key_value = ttk.Frame(right_frame, style='info_value.TFrame')
@@ -364,11 +570,11 @@ class MainPage(ttk.Frame):
         :return: none
         """
         if is_encrypt:
-            make_encryption = encryption.encrypt_file
+            make_encryption = 'encrypt_stream'
             MSG_ENCRYPT = 'Encryption'
         else:
             MSG_ENCRYPT = 'Decryption'
-            make_encryption = encryption.decrypt_file
+            make_encryption = 'decrypt_stream'
 
         if not CryptApp.input_file_name:
             popup_message(f'{MSG_ENCRYPT} failed! (File is not opened)', status=2)
@@ -376,32 +582,86 @@ class MainPage(ttk.Frame):
         elif not encryption.is_keys_configured:
             set_keys = {'Set keys': lambda: controller.show_frame(SelectKeys)}
             popup_message(f'Keys are not configured correctly. Please, fix it!', status=2, **set_keys)
+        elif self.job:
+            popup_message(f'{MSG_ENCRYPT} failed! (Another file is processing)', status=1)
         else:
             if self.save_file():
-                operation_time = time()
-                try:
-                    if make_encryption(CryptApp.input_file_name, self.output_file_name):
-                        operation_time = time() - operation_time
-                        self.label_encrypt_status.configure(
-                            text=f'{MSG_ENCRYPT} successful!', foreground=SUCCESS_COLOR)
-                        self.label_keys_status.configure(
-                            text=f'Total {MSG_ENCRYPT} time: {operation_time} c.',
-                            foreground=SUCCESS_COLOR)
-                        debug_message(f'{MSG_ENCRYPT} successful! Total time: {operation_time}')
-
-                    else:
-                        self.label_encrypt_status.configure(text=f'{MSG_ENCRYPT} failed!',
-                                                            foreground=ERROR_COLOR)
-                    debug_message('{} successful!'.format(MSG_ENCRYPT))
-                    debug_message('Saved as {}'.format(self.output_file_name.split('/')[-1]))
-                except AssertionError:
-                    debug_message(AssertionError)
+                if self.output_file_name == CryptApp.input_file_name:
+                    popup_message(f'{MSG_ENCRYPT} failed! (Output file is the same as input file)', status=2)
+                    return
+                self.start_job(make_encryption, MSG_ENCRYPT)
             else:
                 self.label_keys_status.config(
                     text='{} failed! (File to save is not selected)'.format(MSG_ENCRYPT),
                     foreground=WARNING_COLOR)
                 debug_message('File to save is not selected!')
 
+    def start_job(self, method_name, MSG_ENCRYPT):
+        """
+        Starting encryption or decryption of opened file in worker thread.
+        Job has its own cipher with copy of keys, so keys can be changed
+        while it's running
+        :param method_name: 'encrypt_stream' or 'decrypt_stream'
+        :param MSG_ENCRYPT: name of operation shown in status messages
+        :return: None
+        """
+        cipher = encrypt.ElGamal()
+        cipher.set_keys(deepcopy(encryption.keys))
+        self.job = FileJob(getattr(cipher, method_name), CryptApp.input_file_name, self.output_file_name)
+        self.job_name = MSG_ENCRYPT
+        self.progress_bar.configure(maximum=max(self.job.total, 1), value=0)
+        self.label_progress.configure(text='')
+        self.label_encrypt_status.configure(text=f'{MSG_ENCRYPT}...', foreground=BUTTON_COLOR_LIGHT)
+        self.button_encrypt.state(['disabled'])
+        self.button_decrypt.state(['disabled'])
+        self.progress_frame.grid()
+        debug_message(f'{MSG_ENCRYPT} started...')
+        self.job.start()
+        self.after(PROGRESS_POLL_INTERVAL, self.poll_job)
+
+    def cancel_job(self):
+        """
+        Cancelling running job, partial output is removed by worker thread
+        :return: None
+        """
+        if self.job:
+            self.job.cancel()
+            self.label_encrypt_status.configure(text='Cancelling...', foreground=WARNING_COLOR)
+
+    def poll_job(self):
+        """
+        Updating progress of running job and handling its result
+        :return: None
+        """
+        job = self.job
+        self.progress_bar.configure(value=job.processed)
+        self.label_progress.configure(
+            text=f'{job.processed / 2 ** 20:.1f} of {job.total / 2 ** 20:.1f} MB, {job.speed:.2f} MB/s')
+        if not job.is_done:
+            self.after(PROGRESS_POLL_INTERVAL, self.poll_job)
+            return
+
+        MSG_ENCRYPT = self.job_name
+        self.job = None
+        self.progress_frame.grid_remove()
+        self.button_encrypt.state(['!disabled'])
+        self.button_decrypt.state(['!disabled'])
+        if job.is_cancelled:
+            self.label_encrypt_status.configure(text=f'{MSG_ENCRYPT} cancelled!', foreground=WARNING_COLOR)
+            debug_message(f'{MSG_ENCRYPT} cancelled!')
+        elif job.error:
+            self.label_encrypt_status.configure(text=f'{MSG_ENCRYPT} failed!', foreground=ERROR_COLOR)
+            popup_message(f'{MSG_ENCRYPT} failed! ({job.error})', status=2)
+            debug_message(f'{MSG_ENCRYPT} failed! ({job.error})')
+        else:
+            CryptApp.output_file_name = job.output_file_name
+            self.label_encrypt_status.configure(text=f'{MSG_ENCRYPT} successful!', foreground=SUCCESS_COLOR)
+            self.label_keys_status.configure(
+                text=f'Total {MSG_ENCRYPT} time: {job.elapsed:.2f} c. ({job.speed:.2f} MB/s)',
+                foreground=SUCCESS_COLOR)
+            debug_message(f'{MSG_ENCRYPT} successful! Total time: {job.elapsed}')
+            debug_message('Saved as {}'.format(job.output_file_name.split('/')[-1]))
+
 
 class SelectKeys(ttk.Frame):
     """
@@ -420,6 +680,10 @@ class SelectKeys(ttk.Frame):
         self.public_y_key = tk.IntVar()
         self.private_x_key = tk.IntVar()
         self.session_k_key = tk.IntVar()
+        # Order of subgroup generated with p key (subgroup key profile only)
+        self.subgroup_q = None
+        # Generation of p and g running in worker thread
+        self.params_job = None
 
         self.columnconfigure(0, weight=1)
         self.columnconfigure(1, weight=1)
@@ -501,8 +765,9 @@ class SelectKeys(ttk.Frame):
         public_p_label.grid(column=0, row=2, sticky='n e s')
         self.public_p = ttk.Entry(self, style='key.TEntry', textvariable=self.public_p_key)
         self.public_p.grid(column=1, row=2, sticky='n e s w', pady=5)
-        public_p_generate_button = ttk.Button(self, style='TButton', text='Generate', command=self.generate_p_key)
-        public_p_generate_button.grid(column=2, row=2, sticky='n s w', padx=10)
+        self.public_p_generate_button = ttk.Button(self, style='TButton', text='Generate',
+                                                   command=self.generate_p_key)
+        self.public_p_generate_button.grid(column=2, row=2, sticky='n s w', padx=10)
         public_g_label = ttk.Label(self, style='prefix.TLabel', text='G: ')
         public_g_label.grid(column=0, row=3, sticky='n e s')
         self.public_g = ttk.Entry(self, style='key.TEntry', textvariable=self.public_g_key)
@@ -543,9 +808,9 @@ Also you can keep all fields empty. They will be filled automatically.""")
         cancel_button = ttk.Button(footer_frame, style='TButton', text='Close',
                                    command=lambda: self.update_main(controller))
         cancel_button.grid(column=0, row=0, sticky='s w', padx=10, pady=10)
-        fill_confirm_button = ttk.Button(footer_frame, style='TButton', text='Fill & Confirm',
-                                         command=self.fill_confirm_keys)
-        fill_confirm_button.grid(column=2, row=0, sticky='e s', padx=10, pady=10)
+        self.fill_confirm_button = ttk.Button(footer_frame, style='TButton', text='Fill & Confirm',
+                                              command=self.fill_confirm_keys)
+        self.fill_confirm_button.grid(column=2, row=0, sticky='e s', padx=10, pady=10)
         footer_frame.grid(column=0, columnspan=3, row=10, sticky='e s w')
 
     @staticmethod
@@ -558,22 +823,108 @@ Also you can keep all fields empty. They will be filled automatically.""")
         MainPage.check_keys_status(controller.frames[MainPage])
         controller.show_frame(MainPage)
 
-    def generate_p_key(self):
+    def generate_p_key(self, on_generated=None):
+        """
+        Generating p key if it's not set. For full key profile p is safe prime
+        (p = 2q + 1, q is prime), so primitive root g can be found and checked.
+        p and g are taken from standard group if KEY_GROUP is set, or from parameters
+        pool if it isn't empty. For subgroup profile p = rq + 1 is generated with
+        SUBGROUP_BITS bits prime q, and g generates subgroup of order q.
+        Parameters that must be generated are generated in worker thread, so window
+        isn't frozen, and p and g fields are set when job is done
+        :param on_generated: function called after p and g fields are set
+        :return: None
         """
-        Generating p key if it's not set
-        :return: p key value
+        if self.params_job:
+            return
+        if KEY_GROUP:
+            p, g = groups.get_group(KEY_GROUP)
+            q = (p - 1) // 2 if KEY_PROFILE == encrypt.KEY_PROFILE_SUBGROUP else None
+            self.set_params((p, q, g), on_generated)
+            return
+        if KEY_PROFILE == encrypt.KEY_PROFILE_SUBGROUP:
+            self.params_job = ParamsJob(lambda: primes.generate_subgroup_parameters(KEY_SIZE, SUBGROUP_BITS))
+        else:
+            params = parameter_pool.take(KEY_SIZE)
+            if params:
+                self.set_params((params[0], None, params[1]), on_generated)
+                return
+
+            def generate():
+                # Pool is empty, so parameters are generated in worker thread
+                p, g = parameter_pool.get(KEY_SIZE)
+                return p, None, g
+
+            self.params_job = ParamsJob(generate)
+        self.public_p_generate_button.state(['disabled'])
+        self.fill_confirm_button.state(['disabled'])
+        debug_message('Generating p and g keys...')
+        self.params_job.start()
+        self.after(PROGRESS_POLL_INTERVAL, self.poll_params_job, on_generated)
+
+    def poll_params_job(self, on_generated=None):
         """
-        key = primes.generate_large_prime(key_size=KEY_SIZE)
-        self.public_p_key.set(key)
-        self.generate_g_key()
-        return key
+        Waiting for generation of p and g keys and setting them
+        :param on_generated: function called after p and g fields are set
+        :return: None
+        """
+        job = self.params_job
+        if not job.is_done:
+            self.after(PROGRESS_POLL_INTERVAL, self.poll_params_job, on_generated)
+            return
+
+        self.params_job = None
+        self.public_p_generate_button.state(['!disabled'])
+        self.fill_confirm_button.state(['!disabled'])
+        if job.error:
+            popup_message(f'Generation of p key failed! ({job.error})', status=2)
+            debug_message(f'Generation of p key failed! ({job.error})')
+        else:
+            debug_message('p and g keys were generated')
+            self.set_params(job.params, on_generated)
+
+    def set_params(self, params, on_generated=None):
+        """
+        Setting generated p and g keys
+        :param params: (p, q, g), q is None for full key profile
+        :param on_generated: function called after p and g fields are set
+        :return: None
+        """
+        p, self.subgroup_q, g = params
+        self.public_p_key.set(p)
+        self.public_g_key.set(g)
+        if on_generated:
+            on_generated()
+
+    def subgroup_order(self):
+        """
+        Getting order of subgroup generated with p key, if p wasn't changed after that
+        :return: q value or None for full key profile
+        """
+        p = self.public_p_key.get()
+        if self.subgroup_q and p and (p - 1) % self.subgroup_q == 0:
+            return self.subgroup_q
+        return None
+
+    def exponent_bound(self):
+        """
+        Getting upper bound of random x and k keys
+        :return: bound of keys
+        """
+        public = {'p': self.public_p_key.get()}
+        if self.subgroup_order():
+            public['q'] = self.subgroup_order()
+        return encryption.exponent_bound(public)
 
     def generate_g_key(self):
         """
         Generating g key if it's not set
         :return: g key value
         """
-        key = primes.primitive_roots(self.public_p_key.get())
+        if self.subgroup_order():
+            key = primes.subgroup_generator(self.public_p_key.get(), self.subgroup_order())
+        else:
+            key = primes.primitive_roots(self.public_p_key.get())
         self.public_g_key.set(key)
         return key
 
@@ -585,7 +936,7 @@ Also you can keep all fields empty. They will be filled automatically.""")
         p = self.public_p_key.get()
         if p:
             while True:
-                key = randrange(1, p - 1)
+                key = arithmetic.random_below(self.exponent_bound() - 2) + 2
                 if primes.gcd(key, p) == 1:
                     self.session_k_key.set(key)
                     return key
@@ -599,7 +950,7 @@ Also you can keep all fields empty. They will be filled automatically.""")
         :return: public y key
         """
         if self.public_p_key.get() and self.private_x_key.get() and self.public_p_key.get():
-            key = pow(self.public_g_key.get(), self.private_x_key.get(), self.public_p_key.get())
+            key = arithmetic.power(self.public_g_key.get(), self.private_x_key.get(), self.public_p_key.get())
             self.public_y_key.set(key)
             return key
 
@@ -609,7 +960,7 @@ Also you can keep all fields empty. They will be filled automatically.""")
         :return:
         """
         if self.public_p_key.get():
-            key = randrange(2, self.public_p_key.get() - 1)
+            key = arithmetic.random_below(self.exponent_bound() - 3) + 3
             self.private_x_key.set(key)
             return key
 
@@ -651,18 +1002,25 @@ Also you can keep all fields empty. They will be filled automatically.""")
         """
         if self.check_fields():
             p = self.public_p_key.get()
+            if not encryption.check_p_key(p):
+                # Keys are filled again when p and g are generated
+                self.generate_p_key(on_generated=self.fill_confirm_keys)
+                return
             g = self.public_g_key.get()
             y = self.public_y_key.get()
             x = self.private_x_key.get()
             k = self.session_k_key.get()
+            q = self.subgroup_order()
             keys = {
                 'public': {
-                    'p': p if encryption.check_p_key(p) else self.generate_p_key(),
-                    'g': g if encryption.check_g_key(g, p) else self.generate_g_key()
+                    'p': p,
+                    'g': g if encryption.check_g_key(g, p, q) else self.generate_g_key()
                 },
-                'private': x if encryption.check_x_key(x, p) else self.generate_x_key(),
-                'session': k if encryption.check_k_key(k, p) else self.generate_k_key()
+                'private': x if encryption.check_x_key(x, p, q) else self.generate_x_key(),
+                'session': k if encryption.check_k_key(k, p, q) else self.generate_k_key()
             }
+            if self.subgroup_order():
+                keys['public']['q'] = self.subgroup_order()
             if y and encryption.check_y_key(y, p, g, x):
                 keys['public']['y'] = y
             else:
@@ -737,41 +1095,48 @@ class ShowFile(ttk.Frame):
                                                                                          sticky='n w', padx=10)
         output_label = ttk.Label(self, text='Output ciphertext', style='info.TLabel').grid(column=1, row=0,
                                                                                            sticky='n w', padx=10)
-        input_file_frame = ttk.Frame(self)
-
-        input_scroll = ttk.Scrollbar(input_file_frame, orient='vertical')
-        input_scroll.pack(side='right', fill='y')
-        self.input_file_bytes = tk.Text(input_file_frame,
-                                        font=ENTRY_FONT,
-                                        background=BUTTON_COLOR_LIGHT,
-                                        foreground=BACKGROUND_COLOR_GRAY,
-                                        relief='flat')
-        self.input_file_bytes.pack(fill='both')
-        input_file_frame.grid(padx=10, pady=10, column=0, row=1, sticky='n w e s')
-
-        input_scroll.config(command=self.input_file_bytes.yview)
-        self.input_file_bytes.config(yscrollcommand=input_scroll.set)
-
-        output_file_frame = ttk.Frame(self)
-
-        output_scroll = ttk.Scrollbar(output_file_frame, orient='vertical')
-        output_scroll.pack(side='right', fill='y')
-        self.output_file_bytes = tk.Text(output_file_frame,
-                                         font=ENTRY_FONT,
-                                         background=BUTTON_COLOR_LIGHT,
-                                         foreground=BACKGROUND_COLOR_GRAY,
-                                         relief='flat')
-        self.output_file_bytes.pack(fill='both')
-        output_file_frame.grid(padx=10, pady=10, column=1, row=1, sticky='n w e s')
-
-        output_scroll.config(command=self.output_file_bytes.yview)
-        self.output_file_bytes.config(yscrollcommand=output_scroll.set)
+        self.input_file_bytes = VirtualText(self)
+        self.input_file_bytes.grid(padx=10, pady=10, column=0, row=1, sticky='n w e s')
+        self.output_file_bytes = VirtualText(self)
+        self.output_file_bytes.grid(padx=10, pady=10, column=1, row=1, sticky='n w e s')
+
         button_bar = ttk.Frame(self)
         back_button = ttk.Button(button_bar, style='dark.TButton', text='Back',
-                                 command=lambda: controller.show_frame(MainPage))
+                                 command=lambda: self.close_files(controller))
         back_button.grid(column=0, row=0, padx=10, pady=5, sticky='n w')
         button_bar.grid(column=0, columnspan=2, row=2, sticky='n e s w')
 
+    def open_files(self, controller):
+        """
+        Opening input file and the last output file in viewers and showing page
+        :return: None
+        """
+        self.close_files()
+        for text, file_name in ((self.input_file_bytes, CryptApp.input_file_name),
+                                (self.output_file_bytes, CryptApp.output_file_name)):
+            if file_name and isfile(file_name):
+                try:
+                    text.set_view(open_view(file_name))
+                except OSError as e:
+                    debug_message(f'File {file_name} can\'t be shown ({e})')
+        controller.show_frame(ShowFile)
 
-app = CryptApp()
-app.mainloop()
+    def close_files(self, controller=None):
+        """
+        Closing files shown in viewers, so they can be overwritten, and returning to main page
+        :return: None
+        """
+        for text in (self.input_file_bytes, self.output_file_bytes):
+            if text.view:
+                text.view.close()
+                text.set_view(None)
+        if controller:
+            controller.show_frame(MainPage)
+
+
+if __name__ == '__main__':
+    if not KEY_GROUP and KEY_PROFILE == encrypt.KEY_PROFILE_FULL:
+        # Pool is filled while user selects files, so p key is usually generated without waiting
+        parameter_pool.start_refill(KEY_SIZE)
+    app = CryptApp()
+    app.mainloop()
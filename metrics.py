@@ -0,0 +1,274 @@
+"""
+Performance metrics and tracing: timed spans, counters and instant events.
+
+    with metrics.span('encrypt', mode='block'):
+        ...
+    metrics.count('modexp')
+
+Metrics are collected only if they are enabled (METRICS_ENABLED setting or
+enable()). When they are disabled, span() returns shared empty context and
+count() only checks one flag, so instrumentation can stay in hot paths.
+Spans are summarized by name when they finish, only the last
+METRICS_MAX_EVENTS spans and events are kept for tracing, so memory usage
+is bounded. Collected metrics are exported as JSON (counters and summary
+of spans) or Chrome trace (chrome://tracing, Perfetto). If METRICS_EXPORT_PATH is set,
+metrics are exported when program exits. Metrics of worker processes
+aren't collected.
+"""
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter_ns
+
+from ElGamalCipher.settings import METRICS_ENABLED, METRICS_EXPORT_PATH, METRICS_FORMAT, METRICS_MAX_EVENTS
+
+FORMAT_JSON = 'json'
+FORMAT_CHROME = 'chrome'
+
+_enabled = False
+_lock = threading.Lock()
+_counters = defaultdict(int)
+# Summary of finished spans by name: [count, total, min, max], times in ns
+_spans = {}
+# The last finished spans and instant events: (name, start, duration, thread id, args), times in ns
+_events = deque(maxlen=METRICS_MAX_EVENTS)
+_NULL_SPAN = nullcontext()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Removing all collected metrics
+    :return: None
+    """
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+        _events.clear()
+
+
+def count(name, value=1):
+    """
+    Increasing counter
+    :param name: name of counter
+    :param value: value to add
+    :return: None
+    """
+    if _enabled:
+        with _lock:
+            _counters[name] += value
+
+
+def event(name, **args):
+    """
+    Recording instant event
+    :param name: name of event
+    :param args: details of event
+    :return: None
+    """
+    if _enabled:
+        with _lock:
+            _events.append((name, perf_counter_ns(), None, threading.get_ident(), args))
+
+
+class _Span:
+    """
+    Context manager that records time of code block
+    """
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        with _lock:
+            summary = _spans.get(self.name)
+            if summary is None:
+                _spans[self.name] = [1, duration, duration, duration]
+            else:
+                summary[0] += 1
+                summary[1] += duration
+                summary[2] = min(summary[2], duration)
+                summary[3] = max(summary[3], duration)
+            _events.append((self.name, self.start, duration, threading.get_ident(), self.args))
+        return False
+
+
+def span(name, **args):
+    """
+    Creating timed span
+    :param name: name of span
+    :param args: details of span (e.g. size of key)
+    :return: context manager
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def timed(name):
+    """
+    Decorator that records every call of function as span
+    :param name: name of span
+    :return: decorator
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Getting collected metrics
+    :return: dict with counters, summary of all spans by name (count, total, min and max
+             time in seconds) and list of the last spans and events
+    """
+    with _lock:
+        counters = dict(_counters)
+        spans = {name: {'count': count, 'total': total / 1e9, 'min': low / 1e9, 'max': high / 1e9}
+                 for name, (count, total, low, high) in _spans.items()}
+        events = list(_events)
+
+    return {
+        'counters': counters,
+        'spans': spans,
+        'events': [{'name': name, 'start': start / 1e9, 'duration': None if duration is None else duration / 1e9,
+                    'thread': thread, 'args': args}
+                   for name, start, duration, thread, args in events],
+    }
+
+
+def chrome_trace():
+    """
+    Converting collected metrics to Chrome trace event format
+    :return: dict with list of trace events (times in microseconds)
+    """
+    pid = os.getpid()
+    with _lock:
+        counters = dict(_counters)
+        events = list(_events)
+
+    trace = []
+    end = 0
+    for name, start, duration, thread, args in events:
+        item = {'name': name, 'pid': pid, 'tid': thread, 'ts': start / 1000, 'args': args}
+        if duration is None:
+            item.update({'ph': 'i', 's': 't'})
+        else:
+            item.update({'ph': 'X', 'dur': duration / 1000})
+        trace.append(item)
+        end = max(end, start + (duration or 0))
+    if counters:
+        trace.append({'name': 'counters', 'ph': 'C', 'pid': pid, 'ts': end / 1000, 'args': counters})
+    return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+
+def export(path, format=FORMAT_JSON):
+    """
+    Saving collected metrics to file
+    :param path: path to file
+    :param format: FORMAT_JSON or FORMAT_CHROME
+    :return: None
+    """
+    assert format in (FORMAT_JSON, FORMAT_CHROME), f"Unknown metrics format: {format}"
+    data = snapshot() if format == FORMAT_JSON else chrome_trace()
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, default=str)
+
+
+if METRICS_ENABLED:
+    enable()
+if METRICS_EXPORT_PATH:
+    atexit.register(lambda: _enabled and export(METRICS_EXPORT_PATH, METRICS_FORMAT))
+
+
+if __name__ == '__main__':
+    # Collecting and exporting tests
+    import tempfile
+
+    with span('disabled'):
+        count('disabled')
+    assert span('disabled') is _NULL_SPAN and not snapshot()['counters'], "Disabled metrics are collected!"
+
+    enable()
+    for size in (1, 2, 3):
+        with span('work', size=size):
+            count('items', size)
+    try:
+        with span('work', size=4):
+            raise ValueError()
+    except ValueError:
+        pass
+    event('message', text='done')
+    timed('call')(lambda: None)()
+
+    data = snapshot()
+    assert data['counters'] == {'items': 6}, "Wrong counters!"
+    assert data['spans']['work']['count'] == 4 and data['spans']['call']['count'] == 1, "Wrong summary of spans!"
+    work = data['spans']['work']
+    assert 0 <= work['min'] <= work['max'] <= work['total'], "Wrong times of spans!"
+    names = [item['name'] for item in data['events']]
+    assert names == ['work'] * 4 + ['message', 'call'], f"Wrong events: {names}"
+    assert data['events'][3]['args'] == {'size': 4, 'error': 'ValueError'}, "Error of span isn't recorded!"
+    assert data['events'][4]['duration'] is None, "Instant event has duration!"
+
+    with tempfile.TemporaryDirectory(prefix='elgamal_test_') as work_dir:
+        json_file, trace_file = os.path.join(work_dir, 'metrics.json'), os.path.join(work_dir, 'trace.json')
+        export(json_file)
+        with open(json_file) as f:
+            assert json.load(f) == data, "Exported JSON differs from snapshot!"
+        export(trace_file, FORMAT_CHROME)
+        with open(trace_file) as f:
+            trace = json.load(f)['traceEvents']
+        assert [item['ph'] for item in trace] == ['X'] * 4 + ['i', 'X', 'C'], "Wrong phases of trace events!"
+        assert trace[-1]['args'] == {'items': 6}, "Wrong counters in trace!"
+        assert trace[-1]['ts'] >= max(item['ts'] + item.get('dur', 0) for item in trace[:-1]), \
+            "Counters are recorded before the last event!"
+        try:
+            export(json_file, 'xml')
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("Unknown format is exported!")
+
+    # Only the last events are kept, summary counts all spans
+    for _ in range(METRICS_MAX_EVENTS + 10):
+        event('flood')
+    data = snapshot()
+    assert len(data['events']) == METRICS_MAX_EVENTS and data['spans']['work']['count'] == 4, "Events aren't bounded!"
+
+    reset()
+    assert snapshot() == {'counters': {}, 'spans': {}, 'events': []}, "Metrics aren't reset!"
+    disable()
+    print('All tests passed')
@@ -0,0 +1,175 @@
+"""
+Pool of pre-generated domain parameters (p, g) stored on disk.
+
+Every parameters pair is saved to its own file in directory of its key size,
+so taking parameters is just atomic renaming of one file, and several
+processes can use the same pool. When quantity of parameters in pool falls
+below low watermark, pool is refilled by background thread.
+"""
+import os
+import threading
+from uuid import uuid4
+
+import ElGamalCipher.primes as primes
+from ElGamalCipher.settings import DEFAULT_POOL_PATH, POOL_SIZE, POOL_LOW_WATERMARK
+from ElGamalCipher.core import debug_message
+
+PARAMS_SUFFIX = '.params'
+
+
+class ParameterPool:
+    def __init__(self, path=DEFAULT_POOL_PATH, size=POOL_SIZE, low_watermark=POOL_LOW_WATERMARK):
+        self.path = path
+        self.size = size
+        self.low_watermark = low_watermark
+        self._refill_threads = {}
+        self._lock = threading.Lock()
+
+    def _key_size_path(self, key_size):
+        """
+        Getting directory of parameters with defined key size (it's created if needed)
+        :param key_size: size of p (in bits)
+        :return: path to directory
+        """
+        path = os.path.join(self.path, str(key_size))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _entries(self, key_size):
+        """
+        Getting list of parameters files
+        :param key_size: size of p (in bits)
+        :return: list of paths
+        """
+        path = self._key_size_path(key_size)
+        return [os.path.join(path, name) for name in os.listdir(path) if name.endswith(PARAMS_SUFFIX)]
+
+    def count(self, key_size):
+        """
+        Counting parameters in pool
+        :param key_size: size of p (in bits)
+        :return: quantity of parameters
+        """
+        return len(self._entries(key_size))
+
+    def put(self, key_size, p, g):
+        """
+        Saving parameters to pool. File is written under temporary name and
+        renamed, so partially written parameters are never taken
+        :param key_size: size of p (in bits)
+        :param p: safe prime
+        :param g: primitive root of p
+        :return: None
+        """
+        path = os.path.join(self._key_size_path(key_size), uuid4().hex)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f'{p}\n{g}\n')
+        os.replace(path + '.tmp', path + PARAMS_SUFFIX)
+
+    def take(self, key_size):
+        """
+        Taking one parameters pair from pool. Parameters file is renamed
+        before reading, so the same parameters can't be taken twice
+        :param key_size: size of p (in bits)
+        :return: (p, g) pair or None if pool is empty
+        """
+        params = None
+        for entry in self._entries(key_size):
+            taken = f'{entry}.{os.getpid()}.taken'
+            try:
+                os.rename(entry, taken)
+            except FileNotFoundError:
+                # Parameters were taken by another process
+                continue
+            with open(taken, 'r') as f:
+                p, g = (int(line) for line in f.read().split())
+            os.remove(taken)
+            if p.bit_length() == key_size:
+                params = p, g
+                break
+            debug_message(f'Parameters with wrong key size were removed from pool ({entry})')
+
+        if self.count(key_size) < self.low_watermark:
+            self.start_refill(key_size)
+        return params
+
+    def fill(self, key_size, count=None):
+        """
+        Generating parameters until pool has defined quantity of them
+        :param key_size: size of p (in bits)
+        :param count: required quantity of parameters (pool size by default)
+        :return: quantity of generated parameters
+        """
+        count = self.size if count is None else count
+        generated = 0
+        while self.count(key_size) < count:
+            p = primes.parallel_prime_search(key_size, safe=True).prime
+            self.put(key_size, p, primes.primitive_roots(p))
+            generated += 1
+        return generated
+
+    def start_refill(self, key_size):
+        """
+        Starting background thread that fills pool (if it isn't running yet)
+        :param key_size: size of p (in bits)
+        :return: refill thread
+        """
+        with self._lock:
+            thread = self._refill_threads.get(key_size)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self.fill, args=(key_size,), daemon=True)
+                self._refill_threads[key_size] = thread
+                thread.start()
+                debug_message(f'Refilling parameters pool ({key_size} bits)...')
+        return thread
+
+    def get(self, key_size):
+        """
+        Getting parameters from pool or generating them if pool is empty
+        :param key_size: size of p (in bits)
+        :return: (p, g) pair
+        """
+        params = self.take(key_size)
+        if params is None:
+            p = primes.generate_safe_prime(key_size)
+            params = p, primes.primitive_roots(p)
+        return params
+
+
+if __name__ == '__main__':
+    # Taking, refilling and generating parameters tests
+    import shutil
+    import tempfile
+
+    key_size = 128
+    pool_dir = tempfile.mkdtemp(prefix='elgamal_pool_')
+    try:
+        pool = ParameterPool(pool_dir, size=3, low_watermark=0)
+        assert pool.take(key_size) is None, "Parameters are taken from empty pool!"
+        assert pool.fill(key_size) == 3 and pool.count(key_size) == 3, "Pool isn't filled!"
+        assert pool.fill(key_size) == 0, "Full pool is filled!"
+
+        # Every parameters pair is taken once and it's valid
+        taken = {pool.take(key_size) for _ in range(3)}
+        assert len(taken) == 3 and pool.take(key_size) is None, "Parameters are taken twice!"
+        for p, g in taken:
+            assert p.bit_length() == key_size and primes.is_prime(p) and primes.is_prime((p - 1) // 2), \
+                "p isn't safe prime!"
+            assert pow(g, 2, p) != 1 and pow(g, (p - 1) // 2, p) != 1, "g isn't primitive root!"
+
+        # Parameters with wrong key size are removed
+        p, g = taken.pop()
+        pool.put(key_size, p * p, g)
+        assert pool.take(key_size) is None and not pool.count(key_size), "Parameters with wrong key size are taken!"
+
+        # Empty pool generates parameters and starts refill below low watermark
+        pool.low_watermark = 1
+        p, g = pool.get(key_size)
+        assert p.bit_length() == key_size and primes.is_prime(p), "Generated p isn't prime!"
+        thread = pool.start_refill(key_size)
+        assert pool.start_refill(key_size) is thread, "Second refill thread is started!"
+        thread.join()
+        assert pool.count(key_size) == pool.size, "Pool isn't refilled!"
+    finally:
+        shutil.rmtree(pool_dir)
+    print('All tests passed')
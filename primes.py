@@ -1,4 +1,41 @@
-import random
+import multiprocessing
+import queue
+from bisect import bisect_left
+from collections import namedtuple
+from math import gcd as _gcd, isqrt
+from os import cpu_count
+from time import perf_counter
+
+import ElGamalCipher.arithmetic as arithmetic
+import ElGamalCipher.metrics as metrics
+
+# Trial division in is_prime uses primes below TRIAL_DIVISION_LIMIT, which
+# are multiplied into products of about TRIAL_GROUP_BITS bits
+TRIAL_DIVISION_LIMIT = 1000
+TRIAL_GROUP_BITS = 256
+# Numbers in window of prime candidates are sieved by primes below SIEVE_LIMIT
+SIEVE_LIMIT = 2**16
+# Quantity of odd numbers in one window of prime candidates
+SIEVE_WINDOW = 4096
+
+# Quantity of Miller-Rabin's rounds for random candidates by their size (in bits)
+MILLER_RABIN_ROUNDS = ((1300, 2), (850, 3), (650, 4), (550, 5), (450, 6), (400, 7), (350, 8),
+                       (300, 9), (250, 12), (200, 15), (150, 18), (100, 27), (0, 40))
+# Witnesses that make Miller-Rabin's test deterministic for numbers below 2^64
+DETERMINISTIC_WITNESSES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+# If True, strong Lucas test is run after Miller-Rabin's test (Baillie-PSW test)
+LUCAS_TEST = False
+
+# Time (in seconds) that workers of parallel prime search have to finish
+# their windows after prime is found, then they are terminated
+PRIME_SEARCH_STOP_TIMEOUT = 0.1
+
+# Result of parallel prime search
+PrimeSearchResult = namedtuple('PrimeSearchResult', ['prime', 'candidates', 'time'])
+
+# Tables of small primes and their products, built on first use for every limit
+_small_primes = {}
+_prime_products = {}
 
 
 def primes_sieve(limit):
@@ -17,12 +54,35 @@ def primes_sieve(limit):
                 a[n] = False
 
 
-def rabin_miller(num):
+def miller_rabin_rounds(bits):
     """
-    Implementation of Miller-Rabin's algorithm of checking if number is pseudo-prime
+    Getting quantity of Miller-Rabin's rounds for random candidate of defined
+    size, so that probability of error is less than 2^-80
+    (Handbook of Applied Cryptography, table 4.4)
+    :param bits: size of candidate (in bits)
+    :return: quantity of rounds
+    """
+    for min_bits, rounds in MILLER_RABIN_ROUNDS:
+        if bits >= min_bits:
+            return rounds
+    return MILLER_RABIN_ROUNDS[-1][1]
+
+
+def rabin_miller(num, rounds=None, lucas=LUCAS_TEST):
+    """
+    Implementation of Miller-Rabin's algorithm of checking if number is pseudo-prime.
+    Numbers below 2^64 are checked with deterministic set of witnesses, so
+    result is exact for them
     :param num: number to check
+    :param rounds: quantity of random witnesses (by default it depends on size of number)
+    :param lucas: if True, strong Lucas test is run too (Baillie-PSW test)
     :return: True if number if prime, else false
     """
+    if num < 4:
+        return num > 1
+    if not num % 2:
+        return False
+
     s = num - 1
     t = 0
     while s % 2 == 0:
@@ -31,52 +91,366 @@ def rabin_miller(num):
         s = s // 2
         t += 1
 
-    for trials in range(5):
-        a = random.randrange(2, num - 1)
-        v = pow(a, s, num)
-        if v != 1:
-            i = 0
-            while v != (num - 1):
-                if i == t - 1:
-                    return False
-                else:
-                    i = i + 1
-                    v = (v ** 2) % num
+    if num < 2**64:
+        witnesses = (a for a in DETERMINISTIC_WITNESSES if a % num)
+    else:
+        if rounds is None:
+            rounds = miller_rabin_rounds(num.bit_length())
+        # Witness 2 is always checked, it's needed by Baillie-PSW test
+        witnesses = [2] + [arithmetic.random_below(num - 4) + 3 for _ in range(rounds - 1)]
+
+    for a in witnesses:
+        metrics.count('miller_rabin.rounds')
+        v = arithmetic.power(a, s, num)
+        if v == 1 or v == num - 1:
+            continue
+        for _ in range(t - 1):
+            v = pow(v, 2, num)
+            if v == num - 1:
+                break
+        else:
+            return False
+
+    if lucas and num >= 2**64:
+        return strong_lucas(num)
     return True
 
 
-def is_prime(num):
+def jacobi(a, n):
+    """
+    Calculating Jacobi symbol (a/n)
+    :param a: integer
+    :param n: odd positive integer
+    :return: 1, -1 or 0
+    """
+    a %= n
+    result = 1
+    while a:
+        while not a % 2:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def strong_lucas(num):
+    """
+    Strong Lucas probable prime test with Selfridge's parameters
+    (D is the first of 5, -7, 9, -11, ... with Jacobi symbol (D/num) = -1, P = 1, Q = (1 - D) / 4).
+    Together with Miller-Rabin's test with witness 2 it makes Baillie-PSW test
+    :param num: odd number to check
+    :return: True if number is strong Lucas probable prime, else False
+    """
+    if num < 4:
+        return num > 1
+    if not num % 2 or isqrt(num) ** 2 == num:
+        return False
+
+    d = 5
+    while True:
+        symbol = jacobi(d, num)
+        if symbol == -1:
+            break
+        if symbol == 0 and abs(d) != num:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    q = (1 - d) // 4
+
+    # num + 1 = k * 2^s, k is odd
+    k = num + 1
+    s = 0
+    while not k % 2:
+        k //= 2
+        s += 1
+
+    # Calculating U(k), V(k) and Q^k by bits of k, starting from U(1) = 1, V(1) = P = 1
+    u, v, q_k = 1, 1, q % num
+    for bit in bin(k)[3:]:
+        u, v, q_k = u * v % num, (v * v - 2 * q_k) % num, q_k * q_k % num
+        if bit == '1':
+            u, v = u + v, d * u + v
+            u = (u + num if u % 2 else u) // 2 % num
+            v = (v + num if v % 2 else v) // 2 % num
+            q_k = q_k * q % num
+
+    if u == 0 or v == 0:
+        return True
+    for _ in range(s - 1):
+        v, q_k = (v * v - 2 * q_k) % num, q_k * q_k % num
+        if v == 0:
+            return True
+    return False
+
+
+def small_primes(limit=TRIAL_DIVISION_LIMIT):
+    """
+    Getting table of prime numbers below limit. Table is built once for every limit
+    :param limit: max value of prime number
+    :return: list of prime numbers
+    """
+    if limit not in _small_primes:
+        _small_primes[limit] = list(primes_sieve(limit))
+    return _small_primes[limit]
+
+
+def prime_products(limit=TRIAL_DIVISION_LIMIT):
+    """
+    Getting products of prime numbers below limit, every product is about
+    TRIAL_GROUP_BITS bits. Products are built once for every limit
+    :param limit: max value of prime number
+    :return: list of products
+    """
+    if limit not in _prime_products:
+        products = []
+        product = 1
+        for prime in small_primes(limit):
+            if product.bit_length() + prime.bit_length() > TRIAL_GROUP_BITS:
+                products.append(product)
+                product = 1
+            product *= prime
+        products.append(product)
+        _prime_products[limit] = products
+    return _prime_products[limit]
+
+
+def is_prime(num, limit=TRIAL_DIVISION_LIMIT, lucas=LUCAS_TEST):
     """
     Function of checking if number is prime. It's pre-checking function before
-    running Miller-Rabin's prime number checking algorithm
+    running Miller-Rabin's prime number checking algorithm: number is checked
+    for common divisors with products of small primes (one gcd per product
+    instead of one division per prime)
     :param num: Number for prime checking
+    :param limit: max value of small primes used for pre-checking
+    :param lucas: if True, strong Lucas test is run too (Baillie-PSW test)
     :return: True if number is prime, else False
     """
     if num < 2:
         return False
 
-    low_primes = list(primes_sieve(1000))
-    if num in low_primes:
-        return True
+    low_primes = small_primes(limit)
+    if num <= low_primes[-1]:
+        return low_primes[bisect_left(low_primes, num)] == num
 
-    for prime in low_primes:
-        if not (num % prime):
+    for product in prime_products(limit):
+        if _gcd(num % product, product) != 1:
             return False
 
-    # If all else fails, call rabinMiller() to determine if num is a prime.
-    return rabin_miller(num)
+    # If all else fails, run probable prime test of arithmetic backend
+    return arithmetic.is_probable_prime(num, lucas=lucas)
 
 
 def generate_large_prime(key_size=1024):
     """
-    Generating large prime number with defined size of bits
+    Generating large prime number with defined size of bits. Candidates are
+    searched in windows of odd numbers after random start: the whole window
+    is sieved by small primes at once, and only numbers that survived sieving
+    are checked with Miller-Rabin's algorithm
     :param key_size: size of number to generate (in bits)
     :return: generated prime number
     """
+    with metrics.span('prime.generate', key_size=key_size, safe=False):
+        while True:
+            num, _ = search_prime(key_size)
+            if num:
+                return num
+
+
+def generate_safe_prime(key_size=1024):
+    """
+    Generating safe prime number p = 2q + 1 (q is prime) with defined size
+    of bits. Windows of q candidates are sieved so that both q and 2q + 1
+    have no small divisors, and Miller-Rabin's algorithm is run only for
+    candidates where both numbers survived sieving
+    :param key_size: size of number to generate (in bits)
+    :return: generated safe prime number
+    """
+    with metrics.span('prime.generate', key_size=key_size, safe=True):
+        while True:
+            num, _ = search_prime(key_size, safe=True)
+            if num:
+                return num
+
+
+def generate_subgroup_parameters(key_size=1024, subgroup_bits=256):
+    """
+    Generating Schnorr group: prime p = r * q + 1 with defined size of bits,
+    where q is prime with subgroup_bits bits, and generator g of subgroup of
+    order q. Keys of this group can be subgroup_bits bits long instead of
+    key_size bits
+    :param key_size: size of p (in bits)
+    :param subgroup_bits: size of q (in bits)
+    :return: p, q and g
+    """
+    assert key_size > subgroup_bits + 1, "Size of p must be bigger than size of subgroup order!"
+    q = generate_large_prime(subgroup_bits)
+    while True:
+        # r is even, so p is odd
+        r = arithmetic.random_bits(key_size - subgroup_bits) | (1 << (key_size - subgroup_bits - 1))
+        p = (r & ~1) * q + 1
+        if p.bit_length() == key_size and is_prime(p):
+            return p, q, subgroup_generator(p, q)
+
+
+def subgroup_generator(p, q):
+    """
+    Finding generator of subgroup of prime order q
+    :param p: prime, p - 1 is divisible by q
+    :param q: prime order of subgroup
+    :return: random generator of subgroup
+    """
+    cofactor = (p - 1) // q
     while True:
-        num = random.randrange(2**(key_size-1), 2**key_size)
-        if is_prime(num):
-            return num
+        g = arithmetic.power(arithmetic.random_below(p - 3) + 2, cofactor, p)
+        # g^q = h^(p-1) = 1, so order of g is q if g isn't 1
+        if g != 1:
+            return g
+
+
+def search_prime(key_size=1024, safe=False, on_candidate=None):
+    """
+    One step of prime number search: checking one window of candidates
+    after random start
+    :param key_size: size of number to generate (in bits)
+    :param safe: if True, safe prime p = 2q + 1 is searched
+    :param on_candidate: function called before every candidate is tested (to report progress)
+    :return: found prime number (or None) and quantity of tested candidates
+    """
+    # For safe prime, q is searched, so it's 1 bit shorter than p
+    if safe:
+        key_size -= 1
+    low, high = 2**(key_size-1), 2**key_size
+
+    if low <= SIEVE_LIMIT:
+        # Small numbers can be small primes themselves, so they are checked directly
+        num = low + arithmetic.random_below(high - low)
+        metrics.count('prime.candidates')
+        if on_candidate:
+            on_candidate()
+        if is_prime(num) and (not safe or is_prime(2 * num + 1)):
+            return 2 * num + 1 if safe else num, 1
+        return None, 1
+
+    tested = 0
+    start = (low + arithmetic.random_below(high - low)) | 1
+    # 2 is skipped, because only odd numbers are in window
+    for offset in sieve_window(start, SIEVE_WINDOW, small_primes(SIEVE_LIMIT)[1:], safe):
+        num = start + 2 * offset
+        if num >= high:
+            break
+        tested += 1
+        metrics.count('prime.candidates')
+        if on_candidate:
+            on_candidate()
+        if not safe:
+            if arithmetic.is_probable_prime(num, lucas=LUCAS_TEST):
+                return num, tested
+            continue
+        p = 2 * num + 1
+        # Fermat's test with base 2 quickly rejects most of candidates
+        if arithmetic.power(2, num - 1, num) != 1 or arithmetic.power(2, p - 1, p) != 1:
+            continue
+        # If q is prime, 2^(p-1) = 1 (mod p) proves that p is prime (Pocklington's criterion)
+        if arithmetic.is_probable_prime(num, lucas=LUCAS_TEST):
+            return p, tested
+    return None, tested
+
+
+def _search_prime_worker(key_size, safe, backend, stop, tested, index, results):
+    """
+    Worker process of parallel prime search
+    :param key_size: size of number to generate (in bits)
+    :param safe: if True, safe prime is searched
+    :param backend: name of arithmetic backend
+    :param stop: event that is set when search is finished
+    :param tested: shared array of tested candidates (without lock), one counter per worker
+    :param index: index of counter of this worker
+    :param results: queue for found prime number
+    :return: None
+    """
+    # Spawned workers don't inherit backend selected at runtime
+    arithmetic.set_backend(backend)
+
+    def count_candidate():
+        tested[index] += 1
+
+    while not stop.is_set():
+        num, _ = search_prime(key_size, safe, count_candidate)
+        if num:
+            results.put(num)
+            return
+
+
+def parallel_prime_search(key_size=1024, safe=False, workers=None, timeout=None):
+    """
+    Searching prime number in several processes. When the first prime is
+    found, other workers are stopped after their current window (or
+    terminated if they don't finish it in PRIME_SEARCH_STOP_TIMEOUT)
+    :param key_size: size of number to generate (in bits)
+    :param safe: if True, safe prime p = 2q + 1 is searched
+    :param workers: quantity of worker processes (None is quantity of CPUs)
+    :param timeout: max time of search (in seconds), None is unlimited
+    :return: PrimeSearchResult with prime number, quantity of tested candidates and time of search
+    """
+    workers = workers or cpu_count() or 1
+    stop = multiprocessing.Event()
+    # Every worker has its own counter, so terminated worker can't leave lock acquired
+    tested = multiprocessing.Array('q', workers, lock=False)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_search_prime_worker,
+                                         args=(key_size, safe, arithmetic.get_backend().name, stop, tested, i,
+                                               results),
+                                         daemon=True)
+                 for i in range(workers)]
+
+    start_time = perf_counter()
+    with metrics.span('prime.parallel_search', key_size=key_size, safe=safe, workers=workers):
+        for process in processes:
+            process.start()
+        try:
+            num = results.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'Prime number was not found in {timeout} s ({sum(tested)} candidates tested)')
+        finally:
+            stop.set()
+            deadline = perf_counter() + PRIME_SEARCH_STOP_TIMEOUT
+            for process in processes:
+                process.join(max(deadline - perf_counter(), 0))
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            # Counters of worker processes aren't collected, so candidates are counted here
+            metrics.count('prime.candidates', sum(tested))
+    return PrimeSearchResult(num, sum(tested), perf_counter() - start_time)
+
+
+def sieve_window(start, size, sieve_primes, safe=False):
+    """
+    Sieving window of odd numbers start, start + 2, ..., start + 2 * (size - 1)
+    by small primes
+    :param start: odd number greater than all sieve primes
+    :param size: quantity of numbers in window
+    :param sieve_primes: odd small primes
+    :param safe: if True, numbers q are also removed if 2q + 1 has small divisors
+    :return: generator of offsets i of numbers start + 2 * i without small divisors
+    """
+    window = bytearray([1]) * size
+    for prime in sieve_primes:
+        half = (prime + 1) // 2
+        # start + 2 * i is divisible by prime if i = -start / 2 (mod prime)
+        i = -start * half % prime
+        if i < size:
+            window[i::prime] = bytes((size - 1 - i) // prime + 1)
+        if safe:
+            # 2 * (start + 2 * i) + 1 is divisible by prime if i = (-1/2 - start) / 2 (mod prime)
+            i = (half - 1 - start) * half % prime
+            if i < size:
+                window[i::prime] = bytes((size - 1 - i) // prime + 1)
+    return (i for i, is_candidate in enumerate(window) if is_candidate)
 
 
 def gcd(a, b):
@@ -91,6 +465,31 @@ def gcd(a, b):
     return gcd(b, a % b)
 
 
+def batch_inverse(values, modulus):
+    """
+    Calculating modular inverses of all values with only one modular
+    inversion (Montgomery's trick): product of all values is inverted and
+    every inverse is restored from prefix products
+    :param values: list of values coprime with modulus
+    :param modulus: modulus
+    :return: list of inverses in the same order
+    """
+    if not values:
+        return []
+
+    # prefix[i] is product of values[0..i-1]
+    prefix = [1]
+    for value in values:
+        prefix.append(prefix[-1] * value % modulus)
+
+    inverse = arithmetic.inverse(prefix[-1], modulus)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        inverses[i] = inverse * prefix[i] % modulus
+        inverse = inverse * values[i] % modulus
+    return inverses
+
+
 def primitive_roots(p):
     """
     Finding list of primitive roots of num_p
@@ -106,23 +505,72 @@ def primitive_roots(p):
 
     # test random g's until one is found that is a primitive root mod p
     while True:
-        g = random.randint(2, p - 1)
+        g = arithmetic.random_below(p - 2) + 2
         # g is a primitive root if for all prime factors of p-1, p[i]
         # g^((p-1)/p[i]) (mod p) is not equal to 1
-        if not (pow(g, (p - 1) // p1, p) == 1):
-            if not pow(g, (p - 1) // p2, p) == 1:
+        if not (arithmetic.power(g, (p - 1) // p1, p) == 1):
+            if not arithmetic.power(g, (p - 1) // p2, p) == 1:
                 return g
 
 
 if __name__ == '__main__':
     # Test of generating prime numbers
     print(generate_large_prime())
-    print(primitive_roots(generate_large_prime()))
-    primes_eratosphen = set(primes_sieve(100000))
-    primes_algo = set()
-    for num in range(2, 100000):
-        if is_prime(num):
-            primes_algo.add(num)
-    print('Eratosphen: ' + str(len(primes_eratosphen)))
-    print('Algorithm: ' + str(len(primes_algo)))
-    print(primes_algo-primes_eratosphen)
+    print(primitive_roots(generate_safe_prime()))
+    primes_eratosphen = set(primes_sieve(200000))
+    selected_backend = arithmetic.get_backend().name
+    for backend in arithmetic.available_backends():
+        arithmetic.set_backend(backend)
+        primes_algo = set()
+        for num in range(2, 200000):
+            if is_prime(num):
+                primes_algo.add(num)
+        print('Eratosphen: ' + str(len(primes_eratosphen)))
+        print(f'Algorithm ({backend}): ' + str(len(primes_algo)))
+        print(primes_algo-primes_eratosphen)
+        assert primes_algo == primes_eratosphen, "is_prime doesn't match sieve!"
+
+        # Baillie-PSW test: Mersenne primes 2^521 - 1 and 2^607 - 1 are prime, 2^523 - 1 and
+        # product of two primes aren't
+        mersenne = {521: True, 607: True, 523: False}
+        for exponent, expected in mersenne.items():
+            assert is_prime(2**exponent - 1, lucas=True) == expected, f"Wrong result for 2^{exponent} - 1!"
+        assert not is_prime((2**521 - 1) * (2**607 - 1), lucas=True), "Product of primes is detected as prime!"
+    arithmetic.set_backend(selected_backend)
+
+    # Strong Lucas test passes all odd primes, composites that pass it below 100000 are known (OEIS A217255),
+    # and Miller-Rabin's test rejects all of them
+    lucas_pseudoprimes = [5459, 5777, 10877, 16109, 18971, 22499, 24569, 25199, 40309, 58519, 75077, 97439]
+    assert all(strong_lucas(num) for num in primes_eratosphen if 2 < num < 100000), "Prime fails strong Lucas test!"
+    assert [num for num in range(5, 100000, 2) if strong_lucas(num) and num not in primes_eratosphen] == \
+        lucas_pseudoprimes, "Wrong strong Lucas pseudoprimes!"
+    assert not any(rabin_miller(num) for num in lucas_pseudoprimes), "Strong Lucas pseudoprime passes Baillie-PSW!"
+
+    # Sieved window keeps exactly numbers without small divisors
+    sieve_primes = small_primes(SIEVE_LIMIT)[1:]
+    start = 2**80 + 1
+    offsets = list(sieve_window(start, 1000, sieve_primes))
+    assert offsets == [i for i in range(1000) if all((start + 2 * i) % prime for prime in sieve_primes)], \
+        "Sieve window is wrong!"
+
+    # Safe prime and its half are prime
+    p = generate_safe_prime(256)
+    assert p.bit_length() == 256 and is_prime(p) and is_prime((p - 1) // 2), "Safe prime is wrong!"
+
+    # g generates subgroup of prime order q, q divides p - 1
+    p, q, g = generate_subgroup_parameters(512, 160)
+    assert is_prime(p) and is_prime(q) and (p - 1) % q == 0 and g != 1 and pow(g, q, p) == 1, \
+        "Subgroup parameters are wrong!"
+
+    # Every value multiplied by its batch inverse is 1
+    p = generate_large_prime(512)
+    values = [arithmetic.random_below(p - 1) + 1 for _ in range(100)]
+    assert all(value * inverse % p == 1 for value, inverse in zip(values, batch_inverse(values, p))), \
+        "Batch inverse is wrong!"
+    print('All tests passed')
+
+    # Benchmark of generating safe prime numbers
+    for size in (1024, 2048):
+        start_time = perf_counter()
+        generate_safe_prime(size)
+        print(f'Safe prime ({size} bits): {perf_counter() - start_time:.2f} s')
@@ -19,6 +19,58 @@ WARNING_COLOR = '#EFC61C'
 ERROR_COLOR = '#FC5753'
 
 # Other settings
-DEBUG = True
+DEBUG = False
 KEY_SIZE = 1024
+# Name of standard group (e.g. 'ffdhe2048') used instead of generating p and g, None to generate
+KEY_GROUP = None
 DEFAULT_KEY_PATH = 'elgamal_key'
+# Key profile: 'full' keys are random up to p, 'subgroup' keys belong to
+# subgroup of prime order q (p = rq + 1), and x and k have SUBGROUP_BITS bits
+# (subgroup keys encrypt only in hybrid mode, it's used instead of CIPHER_MODE)
+KEY_PROFILE = 'full'
+SUBGROUP_BITS = 256
+CIPHER_MODE = 'block'
+# Max quantity of shared secrets kept in memory while decrypting
+SECRET_CACHE_SIZE = 256
+# Big-integer arithmetic backend: 'python', 'gmpy2' or 'auto' (gmpy2 if it's installed)
+ARITHMETIC_BACKEND = 'auto'
+# Algorithm of modular power used by python arithmetic backend (see
+# fast_power.POWER_BACKENDS) and max window size (in bits) of sliding window algorithm
+POWER_BACKEND = 'builtin'
+POWER_WINDOW = 5
+# Window size (in bits) of precomputed fixed-base power tables
+FIXED_BASE_WINDOW = 6
+# Max memory (in bytes) of one fixed-base power table, window is reduced for large keys
+FIXED_BASE_MAX_MEMORY = 16 * 1024 * 1024
+# Quantity of powers of the same base calculated without table before table is built
+FIXED_BASE_MIN_USES = 32
+# Size of chunk (in bytes) read or written at once while encrypting streams
+STREAM_CHUNK_SIZE = 64 * 1024
+# Quantity of worker processes used to encrypt files (0 is quantity of CPUs)
+WORKERS = 1
+# Max quantity of chunks in progress per worker process
+PARALLEL_QUEUE_FACTOR = 4
+# Directory of pre-generated (p, g) parameters, quantity of parameters kept
+# for every key size and quantity that starts background refill
+DEFAULT_POOL_PATH = 'elgamal_pool'
+POOL_SIZE = 8
+POOL_LOW_WATERMARK = 2
+# Interval (in milliseconds) of updating progress of running job in GUI
+PROGRESS_POLL_INTERVAL = 100
+# Quantity of bytes shown in one row of file viewer and max quantity of hex
+# digits shown for every alpha and beta value
+VIEWER_ROW_BYTES = 8
+VIEWER_VALUE_DIGITS = 16
+# Benchmark runs before measuring, measured runs, min time (in seconds) of
+# one run and allowed relative slowdown when comparing with baseline
+BENCHMARK_WARMUP = 1
+BENCHMARK_REPEATS = 5
+BENCHMARK_MIN_TIME = 0.05
+BENCHMARK_THRESHOLD = 0.1
+# Collecting of performance metrics (see metrics.py), file to export them
+# to when program exits (None to not export), its format ('json' or 'chrome')
+# and max quantity of the last spans and events kept for tracing
+METRICS_ENABLED = False
+METRICS_EXPORT_PATH = None
+METRICS_FORMAT = 'json'
+METRICS_MAX_EVENTS = 100000
@@ -0,0 +1,238 @@
+"""
+Paged views of large files for GUI viewer. File is memory-mapped and only
+requested rows are read and formatted, so memory usage doesn't depend on
+size of file
+"""
+import mmap
+import struct
+from abc import ABC, abstractmethod
+
+from ElGamalCipher.encryption import FILE_HEADER, FILE_MAGIC, FILE_VERSION, HYBRID_TAG_SIZE, MODE_CODES, MODE_HYBRID
+from ElGamalCipher.settings import VIEWER_ROW_BYTES, VIEWER_VALUE_DIGITS
+
+
+class FileView(ABC):
+    """
+    Memory-mapped file split into rows, subclasses define how rows are counted and formatted
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: path to file
+        """
+        self.file_name = file_name
+        self.file = open(file_name, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file can't be mapped
+            self.data = b''
+
+    @abstractmethod
+    def __len__(self):
+        """
+        :return: quantity of rows
+        """
+
+    @abstractmethod
+    def row(self, index):
+        """
+        Formatting one row of file
+        :param index: index of row
+        :return: text of row
+        """
+
+    def rows(self, start, count):
+        """
+        :param start: index of the first row
+        :param count: max quantity of rows
+        :return: list of row texts
+        """
+        return [self.row(index) for index in range(max(start, 0), min(start + count, len(self)))]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    @staticmethod
+    def format_bytes(offset, data):
+        """
+        Formatting bytes as hex dump row: offset, hex values and printable characters
+        :param offset: position of data in file
+        :param data: bytes of row (at most VIEWER_ROW_BYTES)
+        :return: text of row
+        """
+        text = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in data)
+        return f'{offset:010x}  {data.hex(" "):<{3 * VIEWER_ROW_BYTES}} {text}'
+
+
+class BytesView(FileView):
+    """
+    Hex dump of any file, VIEWER_ROW_BYTES bytes per row
+    """
+
+    def __len__(self):
+        return (len(self.data) + VIEWER_ROW_BYTES - 1) // VIEWER_ROW_BYTES
+
+    def row(self, index):
+        offset = index * VIEWER_ROW_BYTES
+        return self.format_bytes(offset, self.data[offset:offset + VIEWER_ROW_BYTES])
+
+
+class CiphertextView(FileView):
+    """
+    Binary ciphertext file. The first row describes header, every next row is
+    one (alpha, beta) record decoded when it's shown. Hybrid mode file has one
+    record with encrypted secret, followed by hex dump of payload and tag
+    """
+
+    def __init__(self, file_name):
+        FileView.__init__(self, file_name)
+        try:
+            magic, version, self.key_size, self.block_size, mode_code = FILE_HEADER.unpack_from(self.data)
+            assert magic == FILE_MAGIC, "File is not encrypted with ElGamal cipher!"
+            assert version == FILE_VERSION, f"Unsupported file format version: {version}"
+            modes = {code: mode for mode, code in MODE_CODES.items()}
+            assert mode_code in modes, f"Unknown cipher mode code: {mode_code}"
+        except (AssertionError, struct.error):
+            self.close()
+            raise
+        self.mode = modes[mode_code]
+        self.width = (self.key_size + 7) // 8
+
+        body = len(self.data) - FILE_HEADER.size
+        if self.mode == MODE_HYBRID:
+            self.records = min(1, body // (2 * self.width))
+            self.payload_start = FILE_HEADER.size + 2 * self.width * self.records
+            self.payload_size = max(len(self.data) - HYBRID_TAG_SIZE - self.payload_start, 0)
+            self.payload_rows = (self.payload_size + VIEWER_ROW_BYTES - 1) // VIEWER_ROW_BYTES
+        else:
+            self.records = (body + 2 * self.width - 1) // (2 * self.width)
+            self.payload_rows = 0
+
+    def __len__(self):
+        rows = 1 + self.records + self.payload_rows
+        if self.mode == MODE_HYBRID:
+            rows += 1
+        return rows
+
+    def row(self, index):
+        if index == 0:
+            return f'{self.key_size}-bit key, {self.block_size}-byte blocks, {self.mode} mode'
+        index -= 1
+        if index < self.records:
+            return self.format_record(index)
+        index -= self.records
+        if index < self.payload_rows:
+            offset = index * VIEWER_ROW_BYTES
+            size = min(VIEWER_ROW_BYTES, self.payload_size - offset)
+            return self.format_bytes(offset, self.data[self.payload_start + offset:self.payload_start + offset + size])
+        return f'tag: {self.data[-HYBRID_TAG_SIZE:].hex()}'
+
+    def format_record(self, index):
+        """
+        Decoding and formatting one (alpha, beta) record, long values are shortened
+        :param index: index of record
+        :return: text of row
+        """
+        start = FILE_HEADER.size + 2 * self.width * index
+        if start + 2 * self.width > len(self.data):
+            return f'{index:>10}  record is incomplete!'
+        alpha = int.from_bytes(self.data[start:start + self.width], 'big')
+        beta = int.from_bytes(self.data[start + self.width:start + 2 * self.width], 'big')
+        return f'{index:>10}  a={self.shorten(alpha)}  b={self.shorten(beta)}'
+
+    @staticmethod
+    def shorten(value):
+        text = format(value, 'x')
+        if len(text) > VIEWER_VALUE_DIGITS:
+            text = text[:VIEWER_VALUE_DIGITS] + '...'
+        return text
+
+
+def open_view(file_name):
+    """
+    Opening file in view that fits its content: binary ciphertext is shown
+    by records, any other file (including legacy text ciphertext) as hex dump
+    :param file_name: path to file
+    :return: CiphertextView or BytesView
+    """
+    with open(file_name, 'rb') as file:
+        is_ciphertext = file.read(len(FILE_MAGIC)) == FILE_MAGIC
+    if is_ciphertext:
+        try:
+            return CiphertextView(file_name)
+        except (AssertionError, struct.error):
+            pass
+    return BytesView(file_name)
+
+
+if __name__ == '__main__':
+    # Views of plain, ciphertext and damaged files tests
+    import os
+    import shutil
+    import tempfile
+
+    from ElGamalCipher.encryption import ElGamal, MODE_BLOCK
+
+    def write(file_name, data):
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+    def read(file_name):
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+    work_dir = tempfile.mkdtemp(prefix='elgamal_test_')
+    plain_file, cipher_file = (os.path.join(work_dir, name) for name in ('plain', 'cipher'))
+    try:
+        # Hex dump of any file, including empty one
+        for size in (0, 1, VIEWER_ROW_BYTES, VIEWER_ROW_BYTES + 1, 1000):
+            data = os.urandom(size)
+            write(plain_file, data)
+            view = open_view(plain_file)
+            assert isinstance(view, BytesView) and len(view) == -(-size // VIEWER_ROW_BYTES), \
+                f"Wrong rows of {size} bytes file!"
+            dump = b''.join(bytes.fromhex(row[12:12 + 3 * VIEWER_ROW_BYTES]) for row in view.rows(-1, len(view) + 1))
+            assert dump == data, f"Hex dump of {size} bytes file differs!"
+            view.close()
+
+        cipher = ElGamal()
+        cipher.generate_keys(512)
+        width = cipher.record_width()
+        write(plain_file, os.urandom(1000))
+
+        # Block mode: header and one row per record, the last incomplete record is marked
+        cipher.encrypt_file(plain_file, cipher_file, mode=MODE_BLOCK)
+        records = (os.path.getsize(cipher_file) - FILE_HEADER.size) // (2 * width)
+        view = open_view(cipher_file)
+        assert isinstance(view, CiphertextView) and view.mode == MODE_BLOCK and len(view) == 1 + records, \
+            "Wrong rows of block mode file!"
+        assert view.row(0) == f'512-bit key, {cipher.block_size()}-byte blocks, block mode', "Wrong header row!"
+        alpha = int.from_bytes(read(cipher_file)[FILE_HEADER.size:FILE_HEADER.size + width], 'big')
+        assert f'a={CiphertextView.shorten(alpha)}' in view.row(1), "Wrong record row!"
+        view.close()
+        write(cipher_file, read(cipher_file)[:-1])
+        view = open_view(cipher_file)
+        assert len(view) == 1 + records and 'incomplete' in view.row(records), "Incomplete record isn't marked!"
+        view.close()
+
+        # Hybrid mode: header, record of secret, hex dump of payload and tag
+        cipher.encrypt_file(plain_file, cipher_file, mode=MODE_HYBRID)
+        data = read(cipher_file)
+        view = open_view(cipher_file)
+        payload_rows = -(-(len(data) - FILE_HEADER.size - 2 * width - HYBRID_TAG_SIZE) // VIEWER_ROW_BYTES)
+        assert view.mode == MODE_HYBRID and len(view) == 2 + payload_rows + 1, "Wrong rows of hybrid mode file!"
+        assert view.row(len(view) - 1) == f'tag: {data[-HYBRID_TAG_SIZE:].hex()}', "Wrong tag row!"
+        view.close()
+
+        # Files with damaged header are shown as hex dump
+        for damaged in (data[:FILE_HEADER.size - 1], data[:len(FILE_MAGIC)] + b'\xff' * FILE_HEADER.size):
+            write(cipher_file, damaged)
+            view = open_view(cipher_file)
+            assert isinstance(view, BytesView), "File with damaged header is shown as ciphertext!"
+            view.close()
+    finally:
+        shutil.rmtree(work_dir)
+    print('All tests passed')